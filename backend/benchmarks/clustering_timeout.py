@@ -0,0 +1,66 @@
+"""Check that summaries are not starved by timed-out clustering branches.
+
+Runs several analyses in a row whose clustering branch hangs for longer than
+ANALYSIS_CLUSTERING_TIMEOUT. Every analysis must return its summaries within
+the timeout plus a small margin, and branches still queued when their
+analysis gives up must never start. Exits non-zero when either fails.
+
+Usage (from the backend directory):
+    python -m benchmarks.clustering_timeout --timeout 1 --hang 8 --runs 4
+"""
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from services.ai_analysis.feature_analyzer import FeatureAnalyzer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timeout', type=float, default=1.0, help='clustering timeout in seconds')
+    parser.add_argument('--hang', type=float, default=8.0, help='seconds each clustering branch hangs')
+    parser.add_argument('--runs', type=int, default=4, help='analyses to run in a row')
+    parser.add_argument('--margin', type=float, default=1.0, help='allowed seconds beyond the timeout')
+    args = parser.parse_args()
+
+    csv = sorted(glob.glob(os.path.join(REPO_ROOT, '*.csv')))[0]
+    features = pd.read_csv(csv).fillna('').to_dict('records')
+
+    analyzer = FeatureAnalyzer()
+    analyzer.clustering_timeout = args.timeout
+    started = []
+    release = threading.Event()
+
+    def hanging_clustering_stage(*stage_args):
+        started.append(time.perf_counter())
+        release.wait(args.hang)
+        return None
+    analyzer._clustering_stage = hanging_clustering_stage
+
+    failed = False
+    for run in range(args.runs):
+        start = time.perf_counter()
+        result = analyzer.analyze_features(features)
+        elapsed = time.perf_counter() - start
+        ok = elapsed <= args.timeout + args.margin and bool(result['requests_by_category']) \
+            and 'clustering_error' in result
+        failed |= not ok
+        print(f"run {run + 1}: {elapsed:6.2f}s  {'ok' if ok else 'FAILED'}  {result.get('clustering_error')}")
+
+    # Branches cancelled while queued must not start once workers free up
+    release.set()
+    time.sleep(0.5)
+    workers = analyzer.clustering_pool._max_workers
+    print(f"clustering branches started: {len(started)} (at most {workers} may run)")
+    failed |= len(started) > workers
+    analyzer.clustering_pool.shutdown(wait=True)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compare clustering on reduced dimensions against the full embedding width.
+
+For each CSV the features are embedded once, clustered on the full vectors,
+then clustered again after PCA / random projection to each target width. The
+adjusted Rand index against the full-width labels measures how much the
+reduction changes the clusters: once at each run's own threshold, and once
+with the reduced hierarchy cut to the full run's cluster count, which
+separates changes in the tree from changes in the chosen threshold. The
+timings show what the reduction buys. Synthetic 1536-dimensional data can be
+added to time the hierarchy at larger sizes.
+
+Usage (from the backend directory):
+    python -m benchmarks.reduced_dimensions --provider local --dimensions 32 64 128
+    python -m benchmarks.reduced_dimensions --provider openai --synthetic 5000
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import adjusted_rand_score
+
+from services.ai_analysis.clustering_service import CLUSTERING_REDUCTIONS, ClusteringService
+from services.ai_analysis.embeddings_service import EmbeddingsService
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def embed_csv(path: str, provider: str) -> np.ndarray:
+    features = pd.read_csv(path).fillna('').to_dict('records')
+    embedded = EmbeddingsService(provider).embed_features(features)
+    matrix = np.asarray(embedded['embeddings'], dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+def synthetic_embeddings(n_points: int, width: int = 1536, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(12, width))
+    points = centers[rng.integers(0, len(centers), n_points)] + rng.normal(scale=1.0, size=(n_points, width))
+    points = points.astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+def compare(service: ClusteringService, name: str, embeddings: np.ndarray, dimensions, engine: str = None):
+    start = time.perf_counter()
+    full = service._build_hierarchy(embeddings, engine, dimensions=0)
+    full_elapsed = time.perf_counter() - start
+    print(f"{name}: n={len(embeddings)} width={embeddings.shape[1]}")
+    n_clusters = len(np.unique(full['labels']))
+    print(f"  full        {full_elapsed * 1000:9.1f} ms  clusters={n_clusters}")
+
+    for reduction in CLUSTERING_REDUCTIONS:
+        for width in dimensions:
+            if width >= embeddings.shape[1]:
+                continue
+            start = time.perf_counter()
+            reduced = service._build_hierarchy(embeddings, engine, dimensions=width, reduction=reduction)
+            elapsed = time.perf_counter() - start
+            ari = adjusted_rand_score(full['labels'], reduced['labels'])
+            matched = service.cut_linkage(reduced['linkage'], n_clusters=n_clusters)
+            if reduced['leaf_labels'] is not None:
+                matched = matched[reduced['leaf_labels']]
+            matched_ari = adjusted_rand_score(full['labels'], matched)
+            print(f"  {reduction:>6}-{width:<4} {elapsed * 1000:9.1f} ms  clusters={len(np.unique(reduced['labels']))}"
+                  f"  ARI={ari:.3f}  ARI@{n_clusters}={matched_ari:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', nargs='+', default=sorted(glob.glob(os.path.join(REPO_ROOT, '*.csv'))),
+                        help='feature request CSVs to embed (defaults to the sample CSVs in the repo root)')
+    parser.add_argument('--provider', default=None, help='embedding provider (defaults to EMBEDDING_PROVIDER)')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[],
+                        help='also time synthetic 1536-dimensional datasets of these sizes')
+    args = parser.parse_args()
+
+    service = ClusteringService()
+    for path in args.csv:
+        compare(service, os.path.basename(path), embed_csv(path, args.provider), args.dimensions)
+    for n_points in args.synthetic:
+        compare(service, 'synthetic', synthetic_embeddings(n_points), args.dimensions)
+
+if __name__ == '__main__':
+    main()
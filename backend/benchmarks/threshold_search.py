@@ -0,0 +1,102 @@
+"""Benchmark the distance threshold search in ClusteringService.
+
+Compares the single-pass search against the previous per-merge fcluster scan
+and checks that both pick the same threshold.
+
+Usage (from the backend directory):
+    python -m benchmarks.threshold_search --sizes 1000 10000 50000 --legacy-max 10000
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from services.ai_analysis.clustering_service import ClusteringService
+
+def legacy_threshold(Z: np.ndarray, max_clusters: int = 7) -> float:
+    """The previous implementation, kept here as the reference result."""
+    last_merge_distances = Z[:, 2]
+    acceleration = np.diff(np.diff(last_merge_distances))
+    elbow_idx = np.argmax(acceleration) + 2
+    threshold = Z[-(elbow_idx), 2] * 2.5
+    min_threshold = np.percentile(Z[:, 2], 85)
+    n_points = len(Z) + 1
+
+    max_clusters_threshold = None
+    for i in range(len(Z)):
+        n_clusters = len(np.unique(fcluster(Z, Z[i, 2], criterion='distance')))
+        if n_clusters <= max_clusters:
+            max_clusters_threshold = Z[i, 2]
+            break
+    if max_clusters_threshold is not None:
+        threshold = max(threshold, max_clusters_threshold)
+
+    min_size_threshold = None
+    min_cluster_size = max(3, n_points // 10)
+    for i in range(len(Z)):
+        clusters = fcluster(Z, Z[i, 2], criterion='distance')
+        sizes = np.bincount(clusters)
+        if np.all(sizes >= min_cluster_size):
+            min_size_threshold = Z[i, 2]
+            break
+    if min_size_threshold is not None:
+        threshold = max(threshold, min_size_threshold)
+
+    return max(threshold, min_threshold)
+
+def build_linkage(n_points: int, seed: int = 42) -> np.ndarray:
+    """Average-linkage matrix over clustered points.
+
+    Up to 10k rows this is a real cosine linkage over synthetic embeddings;
+    beyond that the pairwise distance matrix no longer fits in memory, so a
+    random merge tree with increasing distances is generated instead.
+    """
+    rng = np.random.default_rng(seed)
+    if n_points <= 10000:
+        centers = rng.normal(size=(12, 64))
+        points = centers[rng.integers(0, len(centers), n_points)] + rng.normal(scale=0.6, size=(n_points, 64))
+        return linkage(points, method='average', metric='cosine')
+
+    active = list(range(n_points))
+    sizes = {i: 1 for i in active}
+    distances = np.sort(rng.gamma(2.0, 0.05, n_points - 1))
+    Z = np.empty((n_points - 1, 4))
+    for step in range(n_points - 1):
+        a, b = rng.choice(len(active), 2, replace=False)
+        left, right = active[a], active[b]
+        for idx in sorted((a, b), reverse=True):
+            active[idx] = active[-1]
+            active.pop()
+        node = n_points + step
+        sizes[node] = sizes[left] + sizes[right]
+        Z[step] = [min(left, right), max(left, right), distances[step], sizes[node]]
+        active.append(node)
+    return Z
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='largest size to also run the quadratic legacy search on')
+    args = parser.parse_args()
+
+    service = ClusteringService()
+    for n_points in args.sizes:
+        Z = build_linkage(n_points)
+
+        start = time.perf_counter()
+        threshold = service._find_optimal_distance_threshold(Z)
+        elapsed = time.perf_counter() - start
+        line = f"n={n_points:>6}  single-pass: {elapsed * 1000:9.1f} ms  threshold={threshold:.6f}"
+
+        if n_points <= args.legacy_max:
+            start = time.perf_counter()
+            expected = legacy_threshold(Z)
+            legacy_elapsed = time.perf_counter() - start
+            line += (f"  legacy: {legacy_elapsed * 1000:9.1f} ms"
+                     f"  match={'yes' if np.isclose(threshold, expected) else 'NO'}")
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@ def init_db():
     """Initialize the database, creating all tables"""
     from models.wizard import ProductContext
     from models.data import FeatureRequestData
+    from models.analysis_job import AnalysisJob
     
     Base.metadata.create_all(bind=engine)
     print("Database tables created successfully!")
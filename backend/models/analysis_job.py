@@ -0,0 +1,45 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Text
+from database import Base
+from models.data import FeatureRequestData
+
+class AnalysisJob(Base):
+    """Model for storing background analysis jobs and their progress"""
+    __tablename__ = 'analysis_jobs'
+
+    id = Column(Integer, primary_key=True)
+    context_id = Column(Integer, ForeignKey('product_contexts.id'), nullable=False)
+    dataset_id = Column(Integer, ForeignKey('feature_requests.id'), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    stage = Column(String(50), nullable=True)  # Last finished analysis stage
+    completed_stages = Column(JSON, nullable=False, default=list)
+    options = Column(JSON, nullable=False, default=dict)  # Analysis parameters (provider, theme mode, ...)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    worker_pid = Column(Integer, nullable=True)  # Process that queued and runs the job
+    heartbeat_at = Column(DateTime, nullable=True)  # Refreshed by that process while the job is active
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self, include_result=False):
+        data = {
+            'id': self.id,
+            'context_id': self.context_id,
+            'dataset_id': self.dataset_id,
+            'status': self.status,
+            'stage': self.stage,
+            'completed_stages': self.completed_stages or [],
+            'options': self.options or {},
+            'error': self.error,
+            'worker_pid': self.worker_pid,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
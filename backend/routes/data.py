@@ -3,6 +3,8 @@ from werkzeug.utils import secure_filename
 from services.file_processor import FileProcessor, FileValidationError
 from models.data import FeatureRequestData
 from database import get_db
+from routes.insights import analysis_jobs
+import os
 import traceback
 import json
 
@@ -60,11 +62,23 @@ def upload_file():
             db.add(feature_request)
             db.commit()
             print("✅ Data saved successfully")
+
+            # Optionally start the analysis now so insights are warm when the
+            # dashboard opens (?analyze=true or ANALYZE_ON_UPLOAD=true)
+            analysis_job = None
+            analyze = request.form.get('analyze', request.args.get('analyze', os.getenv('ANALYZE_ON_UPLOAD', 'false')))
+            if analyze.lower() == 'true':
+                try:
+                    analysis_job = analysis_jobs.submit(feature_request.context_id, feature_request.id)
+                    print(f"🧠 Queued analysis job {analysis_job['id']}")
+                except Exception as job_error:
+                    print(f"⚠️ Could not queue analysis: {str(job_error)}")
             print("\n=== FILE UPLOAD COMPLETE ===")
 
             return jsonify({
                 'message': 'File uploaded successfully',
-                'data': feature_request.to_dict()
+                'data': feature_request.to_dict(),
+                'analysis_job': analysis_job
             }), 201
 
         except Exception as db_error:
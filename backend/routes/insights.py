@@ -1,52 +1,178 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 from datetime import datetime
 from database import get_db
 from models.data import FeatureRequestData
 from services.ai_analysis import FeatureAnalyzer
+from services.ai_analysis.analysis_executor import AnalysisExecutor, StageQueue
+from services.ai_analysis.embedding_providers import PROVIDERS
+from services.ai_analysis.clustering_service import PROJECTION_STRATEGIES, THEME_MODES
+from services.analysis_jobs import ACTIVE_STATUSES, AnalysisJobQueue
+from services.single_flight import SingleFlight, json_default
 import traceback
 import json
+import queue
+import time
 from functools import lru_cache
 
 insights_bp = Blueprint('insights', __name__)
 
-# Initialize the feature analyzer
+# Initialize the feature analyzer; analyses run on a bounded pool so several
+# contexts are processed in parallel
 feature_analyzer = FeatureAnalyzer()
+analysis_executor = AnalysisExecutor(feature_analyzer)
 
 # Cache for insights with TTL of 1 hour
 insights_cache = {}
 
-def get_cached_insights(context_id, processed_data):
-    """Get insights from cache or generate new ones"""
-    cache_key = f"{context_id}_{hash(str(processed_data))}"
-    
-    # Check if we have valid cached insights
+# Streamed analyses poll for stage events this often and send a comment
+# line after this long without events so proxies keep the connection open
+STREAM_POLL_SECONDS = 0.5
+STREAM_HEARTBEAT_SECONDS = 15
+
+def insights_cache_key(context_id, dataset_id, embedding_provider=None, projection=None, theme_mode=None):
+    # Uploads are never modified, so the dataset id identifies its version
+    # in every worker process
+    provider = embedding_provider or feature_analyzer.embeddings_service.default_provider
+    themes = theme_mode or feature_analyzer.clustering_service.theme_mode
+    return f"{context_id}_{dataset_id}_{provider}_{projection or 'auto'}_{themes}"
+
+def _analysis_options(args):
+    """Read the embedding provider, projection and theme mode from ``args``.
+
+    Returns ``(options, error)``; error names the first unknown value.
+    """
+    options = {key: (args.get(key) or '').lower() or None
+               for key in ('embedding_provider', 'projection', 'theme_mode')}
+    if options['embedding_provider'] and options['embedding_provider'] not in PROVIDERS:
+        return options, f"Unknown embedding provider: {options['embedding_provider']}"
+    if options['projection'] and options['projection'] != 'auto' \
+            and options['projection'] not in PROJECTION_STRATEGIES:
+        return options, f"Unknown projection strategy: {options['projection']}"
+    if options['theme_mode'] and options['theme_mode'] not in THEME_MODES:
+        return options, f"Unknown theme mode: {options['theme_mode']}"
+    return options, None
+
+def _latest_dataset(db, context_id):
+    """Get the most recent upload for a context"""
+    return db.query(FeatureRequestData)\
+        .filter_by(context_id=context_id)\
+        .order_by(FeatureRequestData.created_at.desc())\
+        .first()
+
+def cached_insights(cache_key):
+    """Return unexpired cached insights, or None"""
     if cache_key in insights_cache:
-        cached_time, cached_insights = insights_cache[cache_key]
+        cached_time, insights = insights_cache[cache_key]
         # Cache valid for 1 hour
         if (datetime.utcnow() - cached_time).total_seconds() < 3600:
+            return insights
+    return None
+
+def cacheable_insights(insights):
+    # Not when clustering failed and only the summaries are in
+    return isinstance(insights, dict) and not insights.get('clustering_error')
+
+def cache_insights(cache_key, insights):
+    if cacheable_insights(insights):
+        insights_cache[cache_key] = (datetime.utcnow(), insights)
+
+# Callers asking for the same context and dataset version at once share one
+# analysis, within this process and across worker processes
+insights_flight = SingleFlight(cacheable=cacheable_insights)
+
+def start_insights(cache_key, processed_data, dataset_id, context_id, provider, refit_projection=False,
+                   projection=None, theme_mode=None, recluster=False, on_stage=None):
+    """Start or join the analysis for ``cache_key``, returning its future.
+
+    ``on_stage(stage, payload)`` receives the analysis' stage events, those
+    sent before this caller joined first. It gets none when the result is
+    read from another worker process.
+    """
+    def compute(publish):
+        events = analysis_executor.stage_queue()
+        future = analysis_executor.submit(
+            'analyze_features',
+            processed_data,
+            embedding_provider=provider,
+            dataset_id=dataset_id,
+            context_id=context_id,
+            refit_projection=refit_projection,
+            projection=projection,
+            theme_mode=theme_mode,
+            recluster=recluster,
+            on_stage=events
+        )
+        for event in analysis_events(future, events):
+            if event is not None:
+                publish(*event)
+        return future.result()
+
+    future = insights_flight.start(cache_key, compute, fresh=refit_projection or recluster, subscriber=on_stage)
+
+    # Cached even if the caller stops waiting before the end
+    def store(done):
+        if done.exception() is None:
+            cache_insights(cache_key, done.result())
+    future.add_done_callback(store)
+    return future
+
+def analysis_events(future, events):
+    """Yield an analysis' ``(stage, payload)`` events until it finishes.
+
+    Yields None after each STREAM_POLL_SECONDS without an event.
+    """
+    while True:
+        finished = future.done()
+        try:
+            yield events.get(timeout=0 if finished else STREAM_POLL_SECONDS)
+        except queue.Empty:
+            # Every event is queued before the analysis returns
+            if finished:
+                return
+            yield None
+
+def get_cached_insights(context_id, processed_data, embedding_provider=None, dataset_id=None,
+                        refit_projection=False, projection=None, theme_mode=None, recluster=False):
+    """Get insights from cache or generate new ones"""
+    provider = embedding_provider or feature_analyzer.embeddings_service.default_provider
+    cache_key = insights_cache_key(context_id, dataset_id, provider, projection, theme_mode)
+    
+    # Check if we have valid cached insights
+    if not refit_projection and not recluster:
+        insights = cached_insights(cache_key)
+        if insights is not None:
             print("Using cached insights")
-            return cached_insights
+            return insights
     
-    # Generate new insights
+    # Generate new insights, or wait for a concurrent caller's
     print("Generating new insights")
-    insights = feature_analyzer.analyze_features(processed_data)
-    
-    # Cache the results
-    insights_cache[cache_key] = (datetime.utcnow(), insights)
-    return insights
+    return start_insights(
+        cache_key,
+        processed_data,
+        dataset_id,
+        context_id,
+        provider,
+        refit_projection=refit_projection,
+        projection=projection,
+        theme_mode=theme_mode,
+        recluster=recluster
+    ).result()
 
 @insights_bp.route('/fetch-insights/<context_id>')
 def fetch_insights(context_id):
     """Fetch and process insights using AI-powered analysis"""
+    options, error = _analysis_options(request.args)
+    if error:
+        return jsonify({'error': error, 'clusters': []}), 400
+    embedding_provider, projection, theme_mode = \
+        options['embedding_provider'], options['projection'], options['theme_mode']
+
     db = get_db()
     try:
         print(f"\n=== Fetching insights for context {context_id} ===")
         
         # Get the most recent data for this context
-        feature_requests = db.query(FeatureRequestData)\
-            .filter_by(context_id=context_id)\
-            .order_by(FeatureRequestData.created_at.desc())\
-            .first()
+        feature_requests = _latest_dataset(db, context_id)
         
         if not feature_requests:
             print(f"No data found for context {context_id}")
@@ -66,7 +192,16 @@ def fetch_insights(context_id):
         
         try:
             # Get insights from cache or generate new ones
-            insights = get_cached_insights(context_id, feature_requests.processed_data)
+            insights = get_cached_insights(
+                context_id,
+                feature_requests.processed_data,
+                embedding_provider,
+                dataset_id=feature_requests.id,
+                refit_projection=request.args.get('refit_projection', '').lower() == 'true',
+                projection=projection,
+                theme_mode=theme_mode,
+                recluster=request.args.get('recluster', '').lower() == 'true'
+            )
             
             if not insights or not isinstance(insights, dict):
                 print("Invalid insights format")
@@ -103,4 +238,257 @@ def fetch_insights(context_id):
             'clusters': []
         }), 200
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def _sse(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+def _cached_stage_events(insights):
+    """Replay a finished analysis as the stage events a streamed one would send"""
+    yield _sse('aggregates', {key: insights.get(key) for key in (
+        'most_engaged_customers', 'requests_by_category', 'trends_over_time',
+        'requests_by_customer_type', 'average_priority_score'
+    )})
+    if insights.get('cluster_layout'):
+        yield _sse('clusters', insights['cluster_layout'])
+    yield _sse('themes', {
+        'clusters': insights.get('clusters', []),
+        'most_common_requests': insights.get('most_common_requests', []),
+        'source': 'final'
+    })
+    yield _sse('pain_points', {'top_pain_points': insights.get('top_pain_points', [])})
+    yield _sse('result', insights)
+
+@insights_bp.route('/fetch-insights/<context_id>/stream')
+def stream_insights(context_id):
+    """Stream insights as server-sent events, one event per finished analysis stage.
+
+    Events arrive as 'aggregates', 'clusters' (assignments and 2D coordinates
+    per row), 'themes' and 'pain_points', followed by 'result' with the same
+    body as /fetch-insights, or 'error'. In hybrid theme mode a 'themes' event
+    with source 'local' (keyword themes) precedes the final one. Takes the
+    same query parameters.
+    """
+    options, error = _analysis_options(request.args)
+    if error:
+        return jsonify({'error': error, 'clusters': []}), 400
+    embedding_provider, projection, theme_mode = \
+        options['embedding_provider'], options['projection'], options['theme_mode']
+
+    refit_projection = request.args.get('refit_projection', '').lower() == 'true'
+    recluster = request.args.get('recluster', '').lower() == 'true'
+
+    db = get_db()
+    try:
+        feature_requests = _latest_dataset(db, context_id)
+
+        if not feature_requests or not feature_requests.processed_data:
+            return jsonify({
+                'error': 'No data found for this context',
+                'clusters': []
+            }), 200
+
+        processed_data = feature_requests.processed_data
+        dataset_id = feature_requests.id
+    finally:
+        db.close()
+
+    provider = embedding_provider or feature_analyzer.embeddings_service.default_provider
+    cache_key = insights_cache_key(context_id, dataset_id, provider, projection, theme_mode)
+
+    def generate():
+        try:
+            insights = None if refit_projection or recluster else cached_insights(cache_key)
+            if insights is not None:
+                print("Streaming cached insights")
+                yield from _cached_stage_events(insights)
+                return
+
+            events = StageQueue(queue.Queue())
+            future = start_insights(
+                cache_key,
+                processed_data,
+                dataset_id,
+                context_id,
+                provider,
+                refit_projection=refit_projection,
+                projection=projection,
+                theme_mode=theme_mode,
+                recluster=recluster,
+                on_stage=events
+            )
+
+            streamed = False
+            last_sent = time.monotonic()
+            for event in analysis_events(future, events):
+                if event is not None:
+                    streamed = True
+                    last_sent = time.monotonic()
+                    yield _sse(*event)
+                elif time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ': keep-alive\n\n'
+
+            if streamed:
+                yield _sse('result', future.result())
+            else:
+                # Read from a result another worker process persisted
+                yield from _cached_stage_events(future.result())
+
+        except Exception as e:
+            print(f"Error streaming insights: {str(e)}")
+            print(f"Traceback: {traceback.format_exc()}")
+            yield _sse('error', {'error': str(e), 'clusters': []})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@insights_bp.route('/recut/<context_id>')
+def recut_insights(context_id):
+    """Re-cut the latest dataset's stored hierarchy at ?threshold= or ?n_clusters="""
+    options, error = _analysis_options(request.args)
+    if error:
+        return jsonify({'error': error, 'clusters': []}), 400
+
+    try:
+        threshold = request.args.get('threshold', type=float)
+        n_clusters = request.args.get('n_clusters', type=int)
+        if (threshold is None) == (n_clusters is None) or (threshold is not None and threshold <= 0) \
+                or (n_clusters is not None and n_clusters < 1):
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            'error': 'Provide either a positive threshold or n_clusters',
+            'clusters': []
+        }), 400
+
+    db = get_db()
+    try:
+        feature_requests = _latest_dataset(db, context_id)
+
+        if not feature_requests or not feature_requests.processed_data:
+            return jsonify({
+                'error': 'No data found for this context',
+                'clusters': []
+            }), 200
+
+        # Only reads the stored matrix and hierarchy, so it runs inline
+        # instead of queueing behind analyses
+        result = feature_analyzer.recut_clusters(
+            feature_requests.processed_data,
+            dataset_id=feature_requests.id,
+            embedding_provider=options['embedding_provider'] or feature_analyzer.embeddings_service.default_provider,
+            distance_threshold=threshold,
+            n_clusters=n_clusters,
+            theme_mode=options['theme_mode']
+        )
+        print(f"Re-cut context {context_id} into {len(result.get('clusters', []))} clusters")
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"Error re-cutting insights: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            'error': str(e),
+            'clusters': []
+        }), 200
+    finally:
+        db.close()
+
+def run_analysis_job(job, report_stage):
+    """Analyze a job's dataset, reporting stages as they finish and warming the insights cache"""
+    db = get_db()
+    try:
+        feature_requests = db.query(FeatureRequestData).get(job['dataset_id'])
+        if not feature_requests or not feature_requests.processed_data:
+            raise ValueError('No processed data available')
+        processed_data = feature_requests.processed_data
+    finally:
+        db.close()
+
+    options = job['options']
+    provider = options.get('embedding_provider') or feature_analyzer.embeddings_service.default_provider
+    events = StageQueue(queue.Queue())
+    future = start_insights(
+        insights_cache_key(job['context_id'], job['dataset_id'], provider, options.get('projection'),
+                           options.get('theme_mode')),
+        processed_data,
+        job['dataset_id'],
+        job['context_id'],
+        provider,
+        refit_projection=options.get('refit_projection', False),
+        projection=options.get('projection'),
+        theme_mode=options.get('theme_mode'),
+        recluster=options.get('recluster', False),
+        on_stage=events
+    )
+    for event in analysis_events(future, events):
+        # Hybrid keyword themes are a preview; the stage finishes with the final ones
+        if event is not None and event[1].get('source') != 'local':
+            report_stage(event[0])
+    return future.result()
+
+analysis_jobs = AnalysisJobQueue(run_analysis_job)
+
+@insights_bp.route('/analyze/<int:context_id>', methods=['POST'])
+def submit_analysis_job(context_id):
+    """Queue a background analysis of the context's latest dataset"""
+    options = request.get_json(silent=True) or {}
+    options.update({key: value for key, value in request.args.items()})
+
+    analysis_options, error = _analysis_options(options)
+    if error:
+        return jsonify({'error': error}), 400
+
+    db = get_db()
+    try:
+        feature_requests = _latest_dataset(db, context_id)
+        if not feature_requests or not feature_requests.processed_data:
+            return jsonify({'error': 'No data found for this context'}), 404
+        dataset_id = feature_requests.id
+    finally:
+        db.close()
+
+    try:
+        job = analysis_jobs.submit(context_id, dataset_id, {
+            **analysis_options,
+            'refit_projection': str(options.get('refit_projection', '')).lower() == 'true',
+            'recluster': str(options.get('recluster', '')).lower() == 'true'
+        })
+        return jsonify(job), 202
+    except Exception as e:
+        print(f"Error queueing analysis job: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+@insights_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Get a job's status and finished stages"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@insights_bp.route('/jobs/<int:job_id>/result', methods=['GET'])
+def get_analysis_job_result(job_id):
+    """Get a finished job's insights; 202 with the job while it is still queued or running"""
+    job = analysis_jobs.get(job_id, include_result=True)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] in ACTIVE_STATUSES:
+        job.pop('result', None)
+        return jsonify(job), 202
+    if job['result'] is None:
+        return jsonify({'error': job['error'] or f"Job {job['status']}", 'status': job['status']}), 409
+    return jsonify(job['result'])
+
+@insights_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_analysis_job(job_id):
+    """Cancel a queued or running job"""
+    job = analysis_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
@@ -0,0 +1,142 @@
+import calendar
+from typing import Any, Dict, List, Mapping
+
+import numpy as np
+import pandas as pd
+
+# Columns the summaries read; each is factorized once
+CATEGORICAL_COLUMNS = ('Requested By', 'Type', 'Customer Type', 'Priority', 'Customer Impact', 'Business Value')
+DATE_COLUMN = 'Request Date'
+TITLE_COLUMN = 'Feature Title'
+
+# Numeric levels used by the overall priority score
+PRIORITY_LEVELS = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
+IMPACT_LEVELS = {'Low': 1, 'Medium': 2, 'High': 3}
+
+class FeatureAggregates:
+    """Columnar summaries of a feature request table.
+
+    Every column the summaries read is factorized once into integer codes and
+    its distinct values, and request dates are parsed once per distinct
+    value. Counts then come from ``np.bincount`` over the codes and score
+    lookups from the distinct values, so all aggregates cost one hashing
+    pass per column and grow linearly with the number of rows. The frame
+    passed in is never modified.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_rows = len(df)
+        self._columns = {}
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                self._columns[column] = pd.factorize(df[column], use_na_sentinel=True)
+        self._dates = df[DATE_COLUMN] if DATE_COLUMN in df else None
+        self._titles = df[TITLE_COLUMN].notna().to_numpy() if TITLE_COLUMN in df else None
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._columns
+
+    def counts(self, column: str) -> List[tuple]:
+        """Return ``(value, count)`` pairs for a column, most frequent first, ignoring missing values.
+
+        Ties keep the order in which values first appear, like ``value_counts``.
+        """
+        codes, uniques = self._columns[column]
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        order = np.argsort(-counts, kind='stable')
+        return [(uniques[i], int(counts[i])) for i in order if counts[i] > 0]
+
+    def scores(self, column: str, mapping: Mapping[Any, float], default: float = np.nan) -> np.ndarray:
+        """Map every row of a column to a score, using ``default`` for unmapped or missing values."""
+        codes, uniques = self._columns[column]
+        table = np.array([mapping.get(value, default) for value in uniques] + [default], dtype=np.float64)
+        # Missing values have code -1, which picks the trailing default
+        return table[codes]
+
+    def summarize(self) -> Dict[str, Any]:
+        """Compute every embedding-independent summary of the analysis result."""
+        return {
+            'most_engaged_customers': self.customer_engagement(),
+            'requests_by_category': self.requests_by_category(),
+            'trends_over_time': self.monthly_trends(),
+            'requests_by_customer_type': self.requests_by_customer_type(),
+            'average_priority_score': self.priority_score()
+        }
+
+    def customer_engagement(self) -> List[Dict[str, Any]]:
+        """Analyze customer engagement based on request patterns."""
+        try:
+            return [
+                {'customer': requester, 'requests': count}
+                for requester, count in self.counts('Requested By')[:3]
+            ]
+        except Exception as e:
+            print(f"Error analyzing customer engagement: {str(e)}")
+            return []
+
+    def requests_by_category(self) -> List[Dict[str, Any]]:
+        """Get distribution of requests by category/type."""
+        try:
+            return [
+                {'category': category, 'percentage': int((count / self.n_rows) * 100)}
+                for category, count in self.counts('Type')
+            ]
+        except Exception as e:
+            print(f"Error getting requests by category: {str(e)}")
+            return []
+
+    def requests_by_customer_type(self) -> List[Dict[str, Any]]:
+        """Get distribution of requests by customer type."""
+        try:
+            return [
+                {'type': ctype, 'count': count, 'percentage': int((count / self.n_rows) * 100)}
+                for ctype, count in self.counts('Customer Type')
+            ]
+        except Exception as e:
+            print(f"Error getting requests by customer type: {str(e)}")
+            return []
+
+    def monthly_trends(self) -> List[Dict[str, Any]]:
+        """Count requests per calendar month, in month order."""
+        try:
+            if self._dates is None or self._titles is None:
+                raise KeyError(DATE_COLUMN if self._dates is None else TITLE_COLUMN)
+
+            # Parse each distinct date once
+            codes, uniques = pd.factorize(self._dates, use_na_sentinel=True)
+            months = np.append(pd.DatetimeIndex(pd.to_datetime(uniques)).month.to_numpy(dtype=np.float64), np.nan)[codes]
+            dated = ~np.isnan(months)
+            month_index = months[dated].astype(np.int64)
+
+            seen = np.bincount(month_index, minlength=13)
+            requests = np.bincount(month_index, weights=self._titles[dated], minlength=13)
+            return [
+                {'month': calendar.month_abbr[month], 'requests': int(requests[month])}
+                for month in range(1, 13) if seen[month]
+            ]
+        except Exception as e:
+            print(f"Error analyzing temporal patterns: {str(e)}")
+            return []
+
+    def priority_score(self) -> Dict[str, Any]:
+        """Calculate overall priority score based on multiple factors."""
+        try:
+            # Weighted average considering impact and value
+            weighted = (
+                self.scores('Priority', PRIORITY_LEVELS) * 0.4 +
+                self.scores('Customer Impact', IMPACT_LEVELS) * 0.3 +
+                self.scores('Business Value', IMPACT_LEVELS) * 0.3
+            )
+            weighted = weighted[~np.isnan(weighted)]
+            weighted_score = weighted.mean() if len(weighted) else np.nan
+
+            # Normalize to 0-10 scale
+            normalized_score = (weighted_score / 4) * 10
+
+            return {
+                'score': f"{normalized_score:.1f}",
+                'description': 'Based on priority, customer impact, and business value'
+            }
+        except Exception as e:
+            print(f"Error calculating priority score: {str(e)}")
+            return {'score': '0.0', 'description': 'Error calculating score'}
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+from .feature_analyzer import FeatureAnalyzer
+
+DEFAULT_MAX_WORKERS = 2
+EXECUTOR_KINDS = ('thread', 'process')
+
+# Each worker process builds its own analyzer once
+_process_analyzer = None
+
+def _init_worker():
+    global _process_analyzer
+    _process_analyzer = FeatureAnalyzer()
+
+def _call_in_worker(method: str, args: tuple, kwargs: dict) -> Any:
+    return getattr(_process_analyzer, method)(*args, **kwargs)
+
+class StageQueue:
+    """Collects the ``(stage, payload)`` events of one analysis.
+
+    Instances are passed to ``FeatureAnalyzer.analyze_features`` as its
+    ``on_stage`` listener; with process workers the underlying queue is a
+    manager proxy, so events cross the process boundary.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def __call__(self, stage: str, payload: Dict[str, Any]) -> None:
+        self.events.put((stage, payload))
+
+    def get(self, timeout: float = None) -> Tuple[str, Dict[str, Any]]:
+        """Wait for the next event; raises ``queue.Empty`` after ``timeout`` seconds."""
+        return self.events.get(timeout=timeout)
+
+class AnalysisExecutor:
+    """Runs FeatureAnalyzer calls for many contexts on a bounded pool.
+
+    The analysis pipeline keeps its state per call, so analyses of different
+    contexts run in parallel; ANALYSIS_MAX_WORKERS caps how many run at once
+    and further calls queue. Thread workers share one analyzer (and its
+    compiled numba kernels) and suit the BLAS- and numba-heavy stages, which
+    release the GIL. Process workers (ANALYSIS_EXECUTOR=process) each build
+    their own analyzer, also parallelize the pure-Python parts and run the
+    kernels on a main thread, which lets the server exit cleanly when numba's
+    TBB/OpenMP pools are in use; arguments and results are pickled. With
+    either kind, analyses of the same dataset lineage take a file lock and
+    run one at a time.
+    """
+
+    def __init__(self, analyzer: FeatureAnalyzer = None, max_workers: int = None, kind: str = None):
+        self.max_workers = max_workers or int(os.getenv('ANALYSIS_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        self.kind = (kind or os.getenv('ANALYSIS_EXECUTOR', 'thread')).lower()
+        if self.kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown analysis executor: {self.kind}")
+
+        self._manager = None
+        self._manager_lock = threading.Lock()
+        if self.kind == 'process':
+            self.analyzer = None
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        else:
+            self.analyzer = analyzer or FeatureAnalyzer()
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis')
+        print(f"Analysis executor: {self.max_workers} {self.kind} workers")
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """Queue ``analyzer.<method>(*args, **kwargs)``, returning its future."""
+        if self.kind == 'process':
+            return self.pool.submit(_call_in_worker, method, args, kwargs)
+        return self.pool.submit(getattr(self.analyzer, method), *args, **kwargs)
+
+    def stage_queue(self) -> StageQueue:
+        """Create a queue that receives an analysis' stage events from its worker."""
+        if self.kind != 'process':
+            return StageQueue(queue.Queue())
+        with self._manager_lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+        return StageQueue(self._manager.Queue())
+
+    def run(self, method: str, *args, **kwargs) -> Any:
+        """Run an analyzer method on the pool and wait for its result."""
+        return self.submit(method, *args, **kwargs).result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.pool.shutdown(wait=wait)
+        if self._manager is not None:
+            self._manager.shutdown()
@@ -0,0 +1,78 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+DEFAULT_N_KEYWORDS = 5
+
+# Words every feature request uses, which say nothing about a cluster
+REQUEST_STOP_WORDS = {
+    'feature', 'features', 'request', 'requests', 'requested', 'add', 'adding', 'allow', 'allows',
+    'enable', 'implement', 'implementation', 'support', 'ability', 'need', 'needs', 'want', 'like', 'new'
+}
+
+def _feature_text(feature: Dict[str, Any]) -> str:
+    # Titles are short and on-topic, so they count twice against descriptions
+    title = str(feature.get('Feature Title', '') or '')
+    desc = str(feature.get('Description', '') or '')
+    return f"{title} {title} {desc}"
+
+def _phrase(terms: List[str], max_words: int = 5) -> str:
+    """Join the top-ranked terms into a short theme without repeating words.
+
+    The best bigram among the leading terms goes first so the theme reads as
+    a phrase rather than a bag of words.
+    """
+    bigrams = [term for term in terms[:5] if ' ' in term]
+    words = bigrams[0].split() if bigrams else []
+    for term in terms:
+        new_words = [w for w in term.split() if w not in words]
+        if words and len(words) + len(new_words) > max_words:
+            continue
+        words.extend(new_words)
+        if len(words) >= 3:
+            break
+    return ' '.join(word.capitalize() for word in words)
+
+def keyword_themes(cluster_features: Dict[int, List[Dict[str, Any]]],
+                   n_keywords: int = DEFAULT_N_KEYWORDS) -> Dict[int, Dict[str, Any]]:
+    """Label clusters from their most distinctive terms using class-based TF-IDF.
+
+    All features of a cluster are treated as one document. A term scores high
+    when it is frequent within the cluster and rare across the others, so the
+    top terms describe what sets the cluster apart. Returns
+    ``{cluster_id: {'theme': str, 'keywords': [str]}}``; clusters without any
+    usable words get an empty theme.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+
+    cluster_ids = list(cluster_features)
+    documents = [' '.join(_feature_text(f) for f in cluster_features[cid]) for cid in cluster_ids]
+    empty = {cid: {'theme': '', 'keywords': []} for cid in cluster_ids}
+
+    try:
+        vectorizer = CountVectorizer(stop_words=list(ENGLISH_STOP_WORDS | REQUEST_STOP_WORDS), ngram_range=(1, 2),
+                                     token_pattern=r'(?u)\b[a-zA-Z][a-zA-Z0-9]+\b')
+        counts = vectorizer.fit_transform(documents).astype(np.float64)
+    except ValueError:
+        # Only stop words or no text at all
+        return empty
+    terms = vectorizer.get_feature_names_out()
+
+    # c-TF-IDF: term frequency within each cluster, weighted by how rare the
+    # term is across clusters relative to the average cluster size
+    cluster_words = np.asarray(counts.sum(axis=1)).ravel()
+    cluster_words[cluster_words == 0] = 1
+    term_totals = np.asarray(counts.sum(axis=0)).ravel()
+    idf = np.log1p(cluster_words.mean() / term_totals)
+    scores = counts.multiply(1 / cluster_words[:, np.newaxis]).multiply(idf).tocsr()
+
+    results = {}
+    for row, cid in enumerate(cluster_ids):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        if start == end:
+            results[cid] = empty[cid]
+            continue
+        order = np.argsort(-scores.data[start:end], kind='stable')[:max(n_keywords * 2, 10)]
+        ranked = [terms[scores.indices[start + i]] for i in order]
+        results[cid] = {'theme': _phrase(ranked), 'keywords': ranked[:n_keywords]}
+    return results
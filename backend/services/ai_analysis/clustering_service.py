@@ -1,16 +1,29 @@
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List
 import numpy as np
-from sklearn.cluster import AgglomerativeClustering
 from sklearn.metrics import silhouette_score
 from scipy.cluster.hierarchy import linkage, fcluster
+import scipy.sparse as sp
 import openai
 from openai import OpenAI
 import os
+import json
 from dotenv import load_dotenv
 import re
 import traceback
+from contextlib import contextmanager
+import threading
+import time
 import umap
 import logging
+from .projection_store import ClusterStateStore, ProjectionStore
+from .knn_graph import KnnGraph
+from .cluster_keywords import keyword_themes
+from .theme_cache import ThemeCache, member_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: lineages are only serialized within a process
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,19 +32,94 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Above this many rows the dense pairwise-distance hierarchy is replaced by
+# mini-batch k-means micro-clusters merged hierarchically
+DEFAULT_SCALABLE_THRESHOLD = 20000
+MAX_MICRO_CLUSTERS = 1000
+
+# Optional reduction of the vectors the hierarchy is built on. 0 keeps the
+# full embedding width; 64-256 dimensions cut the cost of every pairwise
+# distance (see benchmarks/reduced_dimensions.py for the quality trade-off).
+CLUSTERING_REDUCTIONS = ('pca', 'random')
+DEFAULT_CLUSTERING_DIMENSIONS = 0
+DEFAULT_CLUSTERING_REDUCTION = 'pca'
+PCA_FIT_MAX_ROWS = 20000
+
+# Incremental clustering of a new dataset version: appended rows join the
+# cluster they would merge into under the stored distance threshold, and only
+# leftovers and clusters whose average pairwise distance grows by more than
+# the tolerance are re-clustered. Past the drift threshold (rows added or
+# removed since the last full run, relative to its size) everything is
+# re-clustered from scratch, as it is when the stored threshold was measured
+# between micro-cluster centroids or reduced vectors rather than full rows.
+DEFAULT_INCREMENTAL_DRIFT_THRESHOLD = 0.2
+DEFAULT_INCREMENTAL_COHERENCE_TOLERANCE = 0.05
+
+# Share of rows added or removed since the projection was fitted above which
+# the stored layout is considered stale and refitted
+DEFAULT_PROJECTION_DRIFT_THRESHOLD = 0.2
+
+# Upper bound on the cluster summaries sent in one theme request; larger
+# analyses are labeled in several requests
+DEFAULT_THEME_PROMPT_MAX_CHARS = 24000
+
+# How cluster themes are produced: 'llm' asks the chat model, 'local' uses
+# class-based TF-IDF keywords only, and 'hybrid' reports the keyword themes
+# as soon as they are computed and then lets the model refine them. Without
+# an OpenAI client every mode falls back to the local keywords.
+THEME_MODES = ('llm', 'local', 'hybrid')
+DEFAULT_THEME_MODE = 'hybrid'
+THEME_MODEL = 'gpt-3.5-turbo'
+
+# 2D projection strategies, from highest layout fidelity to lowest latency.
+# 'auto' picks one by dataset size using the row limits below.
+PROJECTION_STRATEGIES = ('umap', 'umap-parallel', 'pca', 'random-knn')
+UMAP_MAX_ROWS = 5000
+UMAP_PARALLEL_MAX_ROWS = 50000
+
+# Rows of the embedding matrix gathered at a time while computing cluster
+# centroids, which bounds the copies made from memory-mapped matrices
+ASSEMBLY_CHUNK_ROWS = 16384
+
 class ClusteringService:
-    """Service for clustering feature requests based on their embeddings using hierarchical clustering."""
+    """Service for clustering feature requests based on their embeddings using hierarchical clustering.
+
+    All per-analysis state lives in local variables, so one instance can serve
+    concurrent analyses; only the persisted state of a dataset lineage is
+    guarded by a per-lineage lock.
+    """
     
     def __init__(self):
         """Initialize the clustering service."""
-        # Initialize UMAP for dimensionality reduction
-        self.reducer = umap.UMAP(
-            n_components=2,
-            random_state=42,
-            min_dist=0.3,
-            n_neighbors=30,
-            metric='cosine'
-        )
+        # UMAP settings for dimensionality reduction; a fresh reducer is
+        # created per fit so fitted state can be persisted per dataset
+        self.umap_params = {
+            'n_components': 2,
+            'random_state': 42,
+            'min_dist': 0.3,
+            'n_neighbors': 30,
+            'metric': 'cosine'
+        }
+        self.projection_strategy = os.getenv('PROJECTION_STRATEGY', 'auto').lower()
+        self.projection_drift_threshold = float(os.getenv('PROJECTION_DRIFT_THRESHOLD', DEFAULT_PROJECTION_DRIFT_THRESHOLD))
+        try:
+            self.projection_store = ProjectionStore()
+        except Exception as e:
+            logger.warning(f"Projection store unavailable: {str(e)}")
+            self.projection_store = None
+        self.incremental = os.getenv('CLUSTERING_INCREMENTAL', 'true').lower() == 'true'
+        self.incremental_drift_threshold = float(os.getenv('CLUSTERING_INCREMENTAL_DRIFT_THRESHOLD',
+                                                           DEFAULT_INCREMENTAL_DRIFT_THRESHOLD))
+        self.incremental_coherence_tolerance = float(os.getenv('CLUSTERING_INCREMENTAL_COHERENCE_TOLERANCE',
+                                                               DEFAULT_INCREMENTAL_COHERENCE_TOLERANCE))
+        # lineage key -> [lock, holders]; entries are dropped once unused
+        self._lineage_locks = {}
+        self._lineage_locks_guard = threading.Lock()
+        try:
+            self.cluster_state_store = ClusterStateStore()
+        except Exception as e:
+            logger.warning(f"Cluster state store unavailable: {str(e)}")
+            self.cluster_state_store = None
         try:
             self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
             if not os.getenv('OPENAI_API_KEY'):
@@ -40,8 +128,66 @@ class ClusteringService:
         except Exception as e:
             logger.warning(f"Could not initialize OpenAI client: {str(e)}")
             self.client = None
+        self.scalable_threshold = int(os.getenv('CLUSTERING_SCALABLE_THRESHOLD', DEFAULT_SCALABLE_THRESHOLD))
+        self.clustering_dimensions = int(os.getenv('CLUSTERING_DIMENSIONS', DEFAULT_CLUSTERING_DIMENSIONS))
+        self.clustering_reduction = os.getenv('CLUSTERING_REDUCTION', DEFAULT_CLUSTERING_REDUCTION).lower()
+        if self.clustering_reduction not in CLUSTERING_REDUCTIONS:
+            logger.warning(f"Unknown CLUSTERING_REDUCTION {self.clustering_reduction}, using {DEFAULT_CLUSTERING_REDUCTION}")
+            self.clustering_reduction = DEFAULT_CLUSTERING_REDUCTION
+        self.theme_prompt_max_chars = int(os.getenv('THEME_PROMPT_MAX_CHARS', DEFAULT_THEME_PROMPT_MAX_CHARS))
+        self.theme_mode = os.getenv('THEME_MODE', DEFAULT_THEME_MODE).lower()
+        if self.theme_mode not in THEME_MODES:
+            logger.warning(f"Unknown THEME_MODE {self.theme_mode}, using {DEFAULT_THEME_MODE}")
+            self.theme_mode = DEFAULT_THEME_MODE
+        try:
+            self.theme_cache = ThemeCache()
+        except Exception as e:
+            logger.warning(f"Theme cache unavailable: {str(e)}")
+            self.theme_cache = None
+
+    def _threshold_sweep(self, Z: np.ndarray):
+        """Walk the linkage matrix once, tracking flat-cluster counts and minimum sizes.
+
+        ``fcluster(Z, t, criterion='distance')`` keeps a merge when the largest
+        merge distance in its subtree is <= t, so the number of flat clusters at
+        t is the number of points minus the merges that satisfy that. Applying
+        merges in that order with union-find style size bookkeeping gives the
+        smallest cluster size after every merge in the same pass.
+
+        Returns ``(n_clusters, min_sizes)`` evaluated at each row's distance.
+        """
+        n_points = len(Z) + 1
+        children = Z[:, :2].astype(np.int64)
+        sizes = Z[:, 3].astype(np.int64)
 
-    def _find_optimal_distance_threshold(self, Z: np.ndarray, min_clusters: int = 3, max_clusters: int = 7) -> float:
+        # Largest merge distance within each node's subtree
+        max_dist = Z[:, 2].copy()
+        for i in range(len(Z)):
+            for child in children[i]:
+                if child >= n_points and max_dist[child - n_points] > max_dist[i]:
+                    max_dist[i] = max_dist[child - n_points]
+
+        order = np.argsort(max_dist, kind='stable')
+        applied = np.searchsorted(max_dist[order], Z[:, 2], side='right')
+
+        # size_counts[s] is the number of current clusters holding s points
+        size_counts = np.zeros(n_points + 1, dtype=np.int64)
+        size_counts[1] = n_points
+        smallest = 1
+        min_size_after = np.empty(n_points, dtype=np.int64)
+        min_size_after[0] = 1
+        for step, node in enumerate(order, start=1):
+            for child in children[node]:
+                size_counts[1 if child < n_points else sizes[child - n_points]] -= 1
+            size_counts[sizes[node]] += 1
+            while size_counts[smallest] == 0:
+                smallest += 1
+            min_size_after[step] = smallest
+
+        return n_points - applied, min_size_after[applied]
+
+    def _find_optimal_distance_threshold(self, Z: np.ndarray, min_clusters: int = 3, max_clusters: int = 7,
+                                         enforce_min_cluster_size: bool = False) -> float:
         """Find optimal distance threshold using elbow method on the dendrogram."""
         try:
             last_merge_distances = Z[:, 2]
@@ -56,31 +202,22 @@ class ClusteringService:
             
             # Add a maximum number of clusters constraint
             n_points = len(Z) + 1
-            max_clusters_threshold = None
+            n_clusters, min_sizes = self._threshold_sweep(Z)
             
             # Ensure we don't exceed max_clusters
-            for i in range(len(Z)):
-                n_clusters = len(np.unique(fcluster(Z, Z[i, 2], criterion='distance')))
-                if n_clusters <= max_clusters:
-                    max_clusters_threshold = Z[i, 2]
-                    break
-            
-            if max_clusters_threshold is not None:
-                threshold = max(threshold, max_clusters_threshold)
+            within_max = np.flatnonzero(n_clusters <= max_clusters)
+            if len(within_max) > 0:
+                threshold = max(threshold, Z[within_max[0], 2])
             
-            # Add a minimum cluster size constraint (at least 10% of total points)
-            min_size_threshold = None
-            min_cluster_size = max(3, n_points // 10)  # At least 10% of points per cluster
-            
-            for i in range(len(Z)):
-                clusters = fcluster(Z, Z[i, 2], criterion='distance')
-                sizes = np.bincount(clusters)
-                if np.all(sizes >= min_cluster_size):
-                    min_size_threshold = Z[i, 2]
-                    break
-            
-            if min_size_threshold is not None:
-                threshold = max(threshold, min_size_threshold)
+            # Add a minimum cluster size constraint (at least 10% of total points).
+            # The original per-merge check ran np.bincount over 1-based fcluster
+            # labels, whose empty bin 0 meant it never passed; it stays opt-in so
+            # thresholds remain comparable with earlier analyses.
+            if enforce_min_cluster_size:
+                min_cluster_size = max(3, n_points // 10)  # At least 10% of points per cluster
+                large_enough = np.flatnonzero(min_sizes >= min_cluster_size)
+                if len(large_enough) > 0:
+                    threshold = max(threshold, Z[large_enough[0], 2])
             
             return max(threshold, min_threshold)
         except Exception as e:
@@ -88,62 +225,765 @@ class ClusteringService:
             # Use an even higher percentile for the fallback
             return np.percentile(Z[:, 2], 90)  # Increased from 80th to 90th percentile
 
-    def _extract_cluster_theme(self, features: List[Dict[str, Any]], embeddings: List[List[float]]) -> str:
-        """Extract a theme that represents all features in the cluster."""
+    def cut_linkage(self, Z: np.ndarray, distance_threshold: float = None, n_clusters: int = None) -> np.ndarray:
+        """Derive 0-based flat cluster labels from a linkage matrix.
+
+        A distance cut merges only below ``distance_threshold``, matching
+        AgglomerativeClustering's ``distance_threshold`` semantics; otherwise the
+        tree is cut into at most ``n_clusters`` clusters.
+        """
+        if distance_threshold is not None:
+            labels = fcluster(Z, np.nextafter(distance_threshold, -np.inf), criterion='distance')
+        else:
+            labels = fcluster(Z, n_clusters, criterion='maxclust')
+        return labels - 1
+
+    def _fallback_theme(self, features: List[Dict[str, Any]]) -> str:
+        """Label a cluster by its first feature's title."""
+        return features[0].get('Feature Title', 'Unknown Theme') if features else 'Unknown Theme'
+
+    def _summarize_cluster(self, features: List[Dict[str, Any]]) -> str:
+        """Summarize a cluster for the theme prompt."""
+        feature_summaries = []
+        for feature in features[:5]:  # Use top 5 features to avoid token limits
+            title = feature.get('Feature Title', '')
+            desc = feature.get('Description', '')
+            if title and desc:
+                feature_summaries.append(f"Feature: {title}\nDescription: {desc}")
+        return "\n\n".join(feature_summaries)
+
+    def _extract_cluster_themes(self, cluster_features: Dict[int, List[Dict[str, Any]]]) -> Dict[int, str]:
+        """Extract a theme for every cluster with one structured request.
+
+        Clusters are sent together and the model answers with a JSON object
+        mapping cluster ids to themes. The request is only split into chunks
+        when the prompt would exceed THEME_PROMPT_MAX_CHARS. Clusters missing
+        from a reply, or whose chunk fails, are left out of the result.
+        """
+        themes = {}
+        if not self.client or not cluster_features:
+            return themes
+
+        # Pack cluster summaries into as few prompts as the size limit allows
+        chunks = []
+        chunk, chunk_chars = [], 0
+        for cluster_id, features in cluster_features.items():
+            section = f"Cluster {cluster_id}:\n{self._summarize_cluster(features)}"
+            if chunk and chunk_chars + len(section) > self.theme_prompt_max_chars:
+                chunks.append(chunk)
+                chunk, chunk_chars = [], 0
+            chunk.append((cluster_id, section))
+            chunk_chars += len(section)
+        if chunk:
+            chunks.append(chunk)
+
+        for chunk in chunks:
+            try:
+                response = self.client.chat.completions.create(
+                    model=THEME_MODEL,
+                    messages=[{
+                        "role": "system",
+                        "content": """You are a feature request analyst. For each cluster of related feature requests, 
+                        extract a concise theme (3-5 words) that accurately represents their common purpose or functionality. 
+                        Focus on the core capability or improvement being requested across all features in the cluster. 
+                        Each theme should be specific enough to be meaningful but general enough to encompass all related features.
+                        Respond with a JSON object mapping each cluster id to its theme, e.g. {"0": "Theme one", "3": "Theme two"}."""
+                    }, {
+                        "role": "user",
+                        "content": "Extract a theme for each of these clusters of related feature requests:\n\n"
+                                   + "\n\n".join(section for _, section in chunk)
+                    }],
+                    response_format={"type": "json_object"},
+                    max_tokens=30 * len(chunk) + 50,
+                    temperature=0.2  # Lower temperature for more consistent output
+                )
+
+                parsed = json.loads(response.choices[0].message.content)
+                if isinstance(parsed.get('themes'), dict):
+                    parsed = parsed['themes']
+                for cluster_id, _ in chunk:
+                    theme = parsed.get(str(cluster_id))
+                    if isinstance(theme, str) and theme.strip():
+                        themes[cluster_id] = theme.strip()
+
+            except Exception as e:
+                logger.error(f"Error extracting cluster themes: {str(e)}")
+
+        return themes
+
+    def _label_clusters(self, cluster_features: Dict[int, List[Dict[str, Any]]], mode: str = None,
+                        on_local: Callable[[Dict[int, Dict[str, Any]]], None] = None) -> Dict[int, Dict[str, Any]]:
+        """Theme every cluster according to the labeling mode.
+
+        Themes of clusters seen before (or with nearly the same members) come
+        from the theme cache. Returns ``{cluster_id: {'theme', 'keywords',
+        'source'}}`` where source is 'llm', 'local' or 'fallback' (the first
+        feature's title). In hybrid mode ``on_local`` receives the keyword
+        labels before the model is asked to refine them.
+        """
+        mode = mode if mode in THEME_MODES else self.theme_mode
+        use_llm = mode != 'local' and self.client is not None
+        labels = {}
+
+        # Themes are cached per labeler; offline fallbacks for the LLM modes
+        # are never stored so they get refined once the model is reachable
+        labeler = f"{mode}:{THEME_MODEL}" if mode != 'local' else 'local'
+        cacheable = self.theme_cache is not None and (use_llm or mode == 'local')
+        members = {cluster_id: [member_id(f) for f in features] for cluster_id, features in cluster_features.items()}
+        if cacheable:
+            try:
+                cached = self.theme_cache.get_many(labeler, members)
+                for cluster_id, entry in cached.items():
+                    labels[cluster_id] = {'theme': entry['theme'], 'keywords': entry['keywords'],
+                                          'source': entry['source']}
+                if cached:
+                    logger.info(f"Reused {len(cached)} of {len(cluster_features)} cluster themes from cache")
+            except Exception as e:
+                logger.error(f"Error reading theme cache: {str(e)}")
+        pending = {cluster_id: features for cluster_id, features in cluster_features.items()
+                   if cluster_id not in labels}
+        if not pending:
+            return labels
+
+        keywords = {}
+        if mode != 'llm' or not use_llm:
+            try:
+                # Keyword scores are relative to the other clusters, so score all of them
+                keywords = keyword_themes(cluster_features)
+            except Exception as e:
+                logger.error(f"Error extracting cluster keywords: {str(e)}")
+
+        for cluster_id, features in pending.items():
+            local = keywords.get(cluster_id, {})
+            if local.get('theme'):
+                labels[cluster_id] = {'theme': local['theme'], 'keywords': local['keywords'], 'source': 'local'}
+            else:
+                labels[cluster_id] = {'theme': self._fallback_theme(features), 'keywords': local.get('keywords', []),
+                                      'source': 'fallback'}
+
+        if use_llm:
+            if on_local and mode == 'hybrid':
+                try:
+                    on_local({cluster_id: dict(label) for cluster_id, label in labels.items()})
+                except Exception as e:
+                    logger.error(f"Error reporting local cluster themes: {str(e)}")
+            for cluster_id, theme in self._extract_cluster_themes(pending).items():
+                labels[cluster_id]['theme'] = theme
+                labels[cluster_id]['source'] = 'llm'
+
+        if cacheable:
+            expected_source = 'llm' if use_llm else 'local'
+            try:
+                self.theme_cache.put_many(labeler, [
+                    dict(labels[cluster_id], members=members[cluster_id])
+                    for cluster_id in pending if labels[cluster_id]['source'] == expected_source
+                ])
+            except Exception as e:
+                logger.error(f"Error writing theme cache: {str(e)}")
+
+        return labels
+
+    def _select_engine(self, n_points: int, engine: str = None) -> str:
+        """Pick the clustering engine, switching to 'scalable' for large inputs."""
+        if engine in ('exact', 'scalable'):
+            return engine
+        return 'scalable' if n_points > self.scalable_threshold else 'exact'
+
+    def _reduce_dimensions(self, embeddings_array: np.ndarray, dimensions: int, method: str = 'pca') -> np.ndarray:
+        """Project unit vectors to ``dimensions`` for clustering and re-normalize them.
+
+        'pca' keeps the directions of highest variance (fitted on a sample of
+        at most PCA_FIT_MAX_ROWS rows); 'random' is a seeded Gaussian random
+        projection, which needs no fitting and roughly preserves cosine
+        similarities.
+        """
+        if method == 'random':
+            from sklearn.random_projection import GaussianRandomProjection
+            reducer = GaussianRandomProjection(n_components=dimensions, random_state=42)
+            reducer.fit(embeddings_array[:1])
+        else:
+            from sklearn.decomposition import PCA
+            reducer = PCA(n_components=min(dimensions, len(embeddings_array)), svd_solver='randomized', random_state=42)
+            if len(embeddings_array) > PCA_FIT_MAX_ROWS:
+                sample = np.random.default_rng(42).choice(len(embeddings_array), PCA_FIT_MAX_ROWS, replace=False)
+                reducer.fit(embeddings_array[np.sort(sample)])
+            else:
+                reducer.fit(embeddings_array)
+
+        reduced = reducer.transform(embeddings_array).astype(np.float32)
+        norms = np.linalg.norm(reduced, axis=1)
+        norms[norms == 0] = 1
+        return reduced / norms[:, np.newaxis]
+
+    def _build_hierarchy(self, embeddings_array: np.ndarray, engine: str = None, dimensions: int = None,
+                         reduction: str = None) -> Dict[str, Any]:
+        """Build the cluster hierarchy and cut it into flat labels.
+
+        The exact engine runs average/cosine linkage over all rows, which needs
+        the O(n^2) pairwise distance matrix. The scalable engine first groups rows
+        into mini-batch k-means micro-clusters and builds the same hierarchy over
+        their centroids, keeping memory near-linear; ``leaf_labels`` then maps
+        each row to its micro-cluster (the leaves of ``linkage``).
+
+        With ``dimensions`` (default CLUSTERING_DIMENSIONS) below the embedding
+        width, the hierarchy is built on vectors reduced by ``reduction``
+        ('pca' or 'random'); everything downstream still uses the full vectors.
+        """
+        n_points = len(embeddings_array)
+        engine = self._select_engine(n_points, engine)
+        leaf_labels = None
+
+        dimensions = self.clustering_dimensions if dimensions is None else dimensions
+        reduction = reduction if reduction in CLUSTERING_REDUCTIONS else self.clustering_reduction
+        if dimensions and dimensions < embeddings_array.shape[1]:
+            try:
+                embeddings_array = self._reduce_dimensions(embeddings_array, dimensions, reduction)
+                logger.info(f"Clustering on {embeddings_array.shape[1]} {reduction} dimensions")
+            except Exception as e:
+                logger.error(f"Error reducing dimensions, clustering full vectors: {str(e)}")
+
+        if engine == 'scalable':
+            from sklearn.cluster import MiniBatchKMeans
+
+            n_micro = min(n_points, MAX_MICRO_CLUSTERS, max(50, int(2 * np.sqrt(n_points))))
+            logger.info(f"Using scalable clustering engine with {n_micro} micro-clusters")
+            kmeans = MiniBatchKMeans(
+                n_clusters=n_micro,
+                batch_size=4096,
+                n_init=3,
+                random_state=42
+            )
+            leaf_labels = kmeans.fit_predict(embeddings_array)
+            # Drop micro-clusters that ended up empty and renumber the rest
+            used, leaf_labels = np.unique(leaf_labels, return_inverse=True)
+            leaves = kmeans.cluster_centers_[used]
+        else:
+            leaves = embeddings_array
+
+        # Generate linkage matrix for hierarchical clustering
+        Z = linkage(leaves, method='average', metric='cosine')
+
+        # Find optimal distance threshold
+        distance_threshold = self._find_optimal_distance_threshold(Z)
+        logger.info(f"Optimal distance threshold: {distance_threshold}")
+
+        # Cut the hierarchy we already built instead of clustering again
         try:
-            if not self.client or not features:
-                return features[0].get('Feature Title', 'Unknown Theme')
-
-            # Prepare a summary of all features in the cluster
-            feature_summaries = []
-            for feature in features[:5]:  # Use top 5 features to avoid token limits
-                title = feature.get('Feature Title', '')
-                desc = feature.get('Description', '')
-                if title and desc:
-                    feature_summaries.append(f"Feature: {title}\nDescription: {desc}")
-
-            cluster_summary = "\n\n".join(feature_summaries)
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{
-                    "role": "system",
-                    "content": """You are a feature request analyst. Analyze multiple related feature requests 
-                    and extract a concise theme (3-5 words) that accurately represents their common purpose or functionality. 
-                    Focus on the core capability or improvement being requested across all features. 
-                    The theme should be specific enough to be meaningful but general enough to encompass all related features."""
-                }, {
-                    "role": "user",
-                    "content": f"Extract a theme that represents these related feature requests:\n\n{cluster_summary}"
-                }],
-                max_tokens=20,
-                temperature=0.2  # Lower temperature for more consistent output
+            labels = self.cut_linkage(Z, distance_threshold=distance_threshold)
+        except Exception as e:
+            logger.error(f"Error in clustering: {str(e)}")
+            # Fallback to a fixed number of clusters
+            labels = self.cut_linkage(Z, n_clusters=5)
+
+        if leaf_labels is not None:
+            labels = labels[leaf_labels]
+
+        return {
+            'engine': engine,
+            'dimensions': int(embeddings_array.shape[1]),
+            # What the threshold's distances are measured between
+            'threshold_space': self._threshold_space('rows' if leaf_labels is None else 'centroids',
+                                                     embeddings_array.shape[1]),
+            'linkage': Z,
+            'leaf_labels': leaf_labels,
+            'distance_threshold': float(distance_threshold),
+            'labels': labels
+        }
+
+    @staticmethod
+    def _threshold_space(points: str, dimensions: int) -> str:
+        return f"{points}:{int(dimensions)}"
+
+    def _cluster_sums(self, embeddings_array: np.ndarray, labels: np.ndarray, n_clusters: int) -> np.ndarray:
+        """Sum the vectors of each cluster; rows labeled -1 are ignored."""
+        sums = np.zeros((n_clusters, embeddings_array.shape[1]))
+        for start in range(0, len(labels), ASSEMBLY_CHUNK_ROWS):
+            chunk = labels[start:start + ASSEMBLY_CHUNK_ROWS]
+            rows = np.flatnonzero(chunk >= 0)
+            membership = sp.csr_matrix(
+                (np.ones(len(rows)), (chunk[rows], rows)),
+                shape=(n_clusters, len(chunk))
             )
-            
-            theme = response.choices[0].message.content.strip()
-            return theme if theme else features[0].get('Feature Title', 'Unknown Theme')
+            sums += membership @ embeddings_array[start:start + ASSEMBLY_CHUNK_ROWS]
+        return sums
+
+    def _incremental_hierarchy(self, embeddings_array: np.ndarray, text_hashes: List[str],
+                               entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Update a previous version's clusters for appended and removed rows.
+
+        Retained rows keep their cluster. A new row joins the cluster with the
+        smallest average cosine distance to its members (``1 - x . mean`` for
+        unit vectors) when that is below the stored distance threshold, i.e.
+        when average linkage would have merged it there. Unassigned rows and
+        the members of clusters whose average pairwise distance grew by more
+        than CLUSTERING_INCREMENTAL_COHERENCE_TOLERANCE are re-linked among
+        themselves, so the cost follows the size of the change. Returns None
+        when the change is too large and a full run is needed, or when the
+        stored threshold was not measured between full-dimension rows and so
+        cannot be compared with these distances.
+
+        The returned linkage is built over the updated clusters rather than
+        the rows, so it can only be re-cut into the same or fewer clusters.
+        """
+        positions = {text_hash: i for i, text_hash in enumerate(entry['text_hashes'])}
+        known = np.array([i for i, text_hash in enumerate(text_hashes) if text_hash in positions], dtype=np.int64)
+        new_rows = np.array([i for i, text_hash in enumerate(text_hashes) if text_hash not in positions], dtype=np.int64)
+        removed = len(positions) - len(set(text_hashes) & positions.keys())
+        changed = entry['changed'] + len(new_rows) + removed
+        drift = changed / max(entry['fit_size'], 1)
+        if len(known) == 0 or drift > self.incremental_drift_threshold:
+            logger.info(f"Stored clusters are stale (drift {drift:.2f}), re-clustering")
+            return None
+        threshold_space = self._threshold_space('rows', embeddings_array.shape[1])
+        if entry.get('threshold_space') != threshold_space:
+            logger.info(f"Stored threshold was measured in {entry.get('threshold_space', 'an unknown space')}, "
+                        f"not {threshold_space}; re-clustering")
+            return None
+
+        threshold = entry['distance_threshold']
+        labels = np.full(len(text_hashes), -1, dtype=np.int64)
+        _, labels[known] = np.unique(entry['labels'][[positions[text_hashes[i]] for i in known]], return_inverse=True)
+        n_clusters = int(labels.max()) + 1
+        counts = np.bincount(labels[known], minlength=n_clusters).astype(np.float64)
+        sums = self._cluster_sums(embeddings_array, labels, n_clusters)
+
+        redo = new_rows
+        n_assigned, degraded = 0, []
+        if len(new_rows):
+            new_vectors = np.asarray(embeddings_array[new_rows], dtype=np.float64)
+            means = sums / counts[:, np.newaxis]
+            scores = new_vectors @ means.T
+            best = np.argmax(scores, axis=1)
+            assigned = 1 - scores[np.arange(len(new_rows)), best] < threshold
+            labels[new_rows[assigned]] = best[assigned]
+
+            # Average pairwise distance of unit vectors is 1 - |mean|^2
+            np.add.at(sums, best[assigned], new_vectors[assigned])
+            new_counts = counts + np.bincount(best[assigned], minlength=n_clusters)
+            before = 1 - np.einsum('ij,ij->i', means, means)
+            new_means = sums / new_counts[:, np.newaxis]
+            after = 1 - np.einsum('ij,ij->i', new_means, new_means)
+            degraded = np.flatnonzero(after > before + self.incremental_coherence_tolerance)
+
+            n_assigned = int(assigned.sum())
+            redo = new_rows[~assigned]
+            if len(degraded):
+                redo = np.concatenate([redo, np.flatnonzero(np.isin(labels, degraded))])
+        logger.info(f"Incremental clustering: {n_assigned} of {len(new_rows)} new rows assigned, {removed} removed, "
+                    f"{len(degraded)} degraded clusters, {len(redo)} rows re-clustered")
+
+        if len(redo) > self.scalable_threshold:
+            logger.info(f"Too many rows to re-cluster incrementally ({len(redo)}), re-clustering everything")
+            return None
+        if len(redo) == 1:
+            labels[redo] = n_clusters
+        elif len(redo) > 1:
+            Z = linkage(embeddings_array[np.sort(redo)], method='average', metric='cosine')
+            labels[np.sort(redo)] = n_clusters + self.cut_linkage(Z, distance_threshold=threshold)
+
+        _, labels = np.unique(labels, return_inverse=True)
+        n_clusters = int(labels.max()) + 1
+
+        # A hierarchy over the clusters themselves keeps coarser re-cuts possible
+        Z = None
+        if n_clusters > 1:
+            means = self._cluster_sums(embeddings_array, labels, n_clusters) / \
+                np.bincount(labels, minlength=n_clusters)[:, np.newaxis]
+            Z = linkage(means, method='average', metric='cosine')
+
+        return {
+            'engine': 'incremental',
+            'dimensions': int(embeddings_array.shape[1]),
+            'threshold_space': threshold_space,
+            'linkage': Z,
+            'leaf_labels': labels if Z is not None else None,
+            'distance_threshold': float(threshold),
+            'labels': labels,
+            'changed': changed
+        }
+
+    def _select_projection(self, n_points: int, strategy: str = None) -> str:
+        """Resolve the projection strategy, choosing by dataset size for 'auto'."""
+        strategy = (strategy or self.projection_strategy).lower()
+        if strategy in PROJECTION_STRATEGIES:
+            return strategy
+        if n_points <= UMAP_MAX_ROWS:
+            return 'umap'
+        if n_points <= UMAP_PARALLEL_MAX_ROWS:
+            return 'umap-parallel'
+        return 'random-knn'
+
+    def _random_knn_projection(self, embeddings_array: np.ndarray, knn_graph: KnnGraph,
+                               n_neighbors: int = 15, iterations: int = 3) -> np.ndarray:
+        """Fast layout: random projection, PCA to 2D, then kNN smoothing.
+
+        Rows are sketched into 32 dimensions with a Gaussian random projection
+        and laid out on the sketch's first two principal components. Each point
+        is then pulled towards the mean of its nearest neighbours in the shared
+        kNN graph so local neighbourhoods stay together.
+        """
+        from sklearn.decomposition import PCA
+        from sklearn.random_projection import GaussianRandomProjection
+
+        sketch = embeddings_array
+        if embeddings_array.shape[1] > 32:
+            sketch = GaussianRandomProjection(n_components=32, random_state=42).fit_transform(embeddings_array)
+        coordinates = PCA(n_components=2, svd_solver='randomized', random_state=42).fit_transform(sketch)
+
+        # The first neighbour of every row is the row itself
+        neighbors = knn_graph.get()[0][:, 1:n_neighbors + 1]
+        if neighbors.shape[1] == 0:
+            return coordinates
+        for _ in range(iterations):
+            coordinates = 0.5 * coordinates + 0.5 * coordinates[neighbors].mean(axis=1)
+        return coordinates
+
+    def _fit_projection(self, embeddings_array: np.ndarray, strategy: str = 'umap', knn_graph: KnnGraph = None):
+        """Fit a new 2D projection, returning ``(coordinates, reducer)``.
+
+        The reducer is None when the strategy cannot place new rows later
+        ('random-knn') or when UMAP failed and PCA was used instead.
+        """
+        from sklearn.decomposition import PCA
+
+        knn_graph = knn_graph or KnnGraph(embeddings_array, n_neighbors=self.umap_params['n_neighbors'])
+        if strategy == 'pca':
+            reducer = PCA(n_components=2)
+            return reducer.fit_transform(embeddings_array), reducer
+        if strategy == 'random-knn':
+            return self._random_knn_projection(embeddings_array, knn_graph), None
 
+        logger.info(f"Reducing dimensionality with UMAP ({strategy})...")
+        try:
+            params = dict(self.umap_params)
+            if strategy == 'umap-parallel':
+                # A fixed random_state forces UMAP onto a single thread
+                params.update(random_state=None, n_jobs=-1)
+            indices, distances, search_index = knn_graph.get()
+            if indices.shape[1] >= params['n_neighbors']:
+                # UMAP edits the neighbour arrays in place, so hand it copies
+                params['precomputed_knn'] = (indices.copy(), distances.copy(), search_index)
+            reducer = umap.UMAP(**params)
+            # UMAP's compiled kernels reject read-only (memory-mapped) arrays
+            return reducer.fit_transform(np.require(embeddings_array, requirements=['W'])), reducer
         except Exception as e:
-            logger.error(f"Error extracting cluster theme: {str(e)}")
-            return features[0].get('Feature Title', 'Unknown Theme')
+            logger.error(f"Error in UMAP reduction: {str(e)}")
+            # Fallback to PCA if UMAP fails
+            pca = PCA(n_components=2)
+            return pca.fit_transform(embeddings_array), None
+
+    def _project(self, embeddings_array: np.ndarray, text_hashes: List[str] = None, projection_key: str = None,
+                 dataset_version: Any = None, refit: bool = False, strategy: str = 'umap',
+                 knn_graph: KnnGraph = None) -> np.ndarray:
+        """Project embeddings to 2D, reusing the dataset's fitted reducer when possible.
+
+        Rows placed before keep their stored coordinates and appended rows are
+        placed into the existing layout with ``transform()``. The projection is
+        refitted on request, when nothing is stored yet, or when the rows added
+        and removed since the last fit exceed PROJECTION_DRIFT_THRESHOLD.
+        """
+        if not projection_key or text_hashes is None or not self.projection_store or strategy == 'random-knn':
+            return self._fit_projection(embeddings_array, strategy, knn_graph)[0]
+
+        entry = None if refit else self.projection_store.load(projection_key)
+        if entry and entry.get('strategy', 'umap') != strategy:
+            logger.info(f"Stored projection used '{entry.get('strategy', 'umap')}', refitting with '{strategy}'")
+            entry = None
+        if entry:
+            positions = {text_hash: i for i, text_hash in enumerate(entry['text_hashes'])}
+            new_rows = [i for i, text_hash in enumerate(text_hashes) if text_hash not in positions]
+            removed = len(positions) - len(set(text_hashes) & positions.keys())
+            drift = (entry['transformed'] + len(new_rows) + removed) / max(entry['fit_size'], 1)
+
+            if drift <= self.projection_drift_threshold:
+                logger.info(f"Reusing stored projection ({len(new_rows)} new rows, drift {drift:.2f})")
+                coordinates = np.empty((len(text_hashes), 2), dtype=np.float64)
+                known = [i for i, text_hash in enumerate(text_hashes) if text_hash in positions]
+                coordinates[known] = entry['coordinates'][[positions[text_hashes[i]] for i in known]]
+                if new_rows:
+                    try:
+                        coordinates[new_rows] = entry['reducer'].transform(embeddings_array[new_rows])
+                    except Exception as e:
+                        logger.error(f"Error placing new rows in stored projection: {str(e)}")
+                        entry = None
 
-    def _ensure_list(self, arr) -> List[float]:
-        """Convert numpy array to list and ensure all values are finite."""
-        if isinstance(arr, np.ndarray):
-            arr = arr.tolist()
-        return [float(x) if not np.isnan(x) else 0.0 for x in arr]
+                if entry is not None:
+                    if new_rows:
+                        entry['text_hashes'] = list(entry['text_hashes']) + [text_hashes[i] for i in new_rows]
+                        entry['coordinates'] = np.vstack([entry['coordinates'], coordinates[new_rows]])
+                        entry['transformed'] += len(new_rows)
+                    entry['version'] = dataset_version
+                    self._save_projection(projection_key, entry)
+                    return coordinates
+            else:
+                logger.info(f"Stored projection is stale (drift {drift:.2f}), refitting")
 
-    def _validate_coordinates(self, coords) -> bool:
-        """Validate that coordinates are valid numbers."""
+        coordinates, reducer = self._fit_projection(embeddings_array, strategy, knn_graph)
+        if reducer is not None:
+            self._save_projection(projection_key, {
+                'reducer': reducer,
+                'strategy': strategy,
+                'version': dataset_version,
+                'text_hashes': list(text_hashes),
+                'coordinates': np.asarray(coordinates),
+                'fit_size': len(text_hashes),
+                'transformed': 0
+            })
+        return coordinates
+
+    @contextmanager
+    def _lineage_lock(self, lineage_key: str = None):
+        """Serialize analyses of one dataset lineage across threads and worker processes.
+
+        Threads of this process share a lock held only while someone uses
+        it; processes additionally take an exclusive lock on the lineage's
+        lock file next to its stored cluster state.
+        """
+        if not lineage_key:
+            yield
+            return
+        with self._lineage_locks_guard:
+            entry = self._lineage_locks.setdefault(lineage_key, [threading.Lock(), 0])
+            entry[1] += 1
         try:
-            return (len(coords) == 2 and 
-                   all(isinstance(x, (int, float)) for x in coords) and 
-                   all(not np.isnan(x) and not np.isinf(x) for x in coords))
-        except:
-            return False
-
-    def cluster_features(self, embedded_features: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Cluster feature requests using hierarchical clustering."""
+            with entry[0]:
+                store = self.cluster_state_store or self.projection_store
+                if fcntl is None or store is None:
+                    yield
+                    return
+                with open(store.lock_path(lineage_key), 'a+') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self._lineage_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._lineage_locks[lineage_key]
+
+    def _save_cluster_state(self, state_key: str, entry: Dict[str, Any]) -> None:
+        """Persist a lineage's cluster assignments, logging rather than failing on errors."""
+        try:
+            self.cluster_state_store.save(state_key, entry)
+        except Exception as e:
+            logger.error(f"Error saving cluster state: {str(e)}")
+
+    def _save_projection(self, projection_key: str, entry: Dict[str, Any]) -> None:
+        """Persist a projection entry, logging rather than failing on errors."""
+        try:
+            self.projection_store.save(projection_key, entry)
+        except Exception as e:
+            logger.error(f"Error saving projection: {str(e)}")
+
+    def _assemble_clusters(self, features: List[Dict[str, Any]], cluster_labels: np.ndarray,
+                           coordinates_2d: np.ndarray, embeddings_array: np.ndarray) -> List[Dict[str, Any]]:
+        """Group features into clusters with their centroids, coherence and field counts.
+
+        Points without finite 2D coordinates are left out. Sizes, centroids,
+        distances and priority / customer type counts are computed for all
+        clusters at once; Python only loops to build the output dicts.
+        Clusters are returned unlabeled ('theme' is None).
+        """
+        coordinates_2d = np.asarray(coordinates_2d, dtype=np.float64).reshape(len(features), -1)
+        valid_idx = np.flatnonzero(np.isfinite(coordinates_2d).all(axis=1)) if coordinates_2d.shape[1] == 2 \
+            else np.array([], dtype=np.int64)
+        if len(valid_idx) == 0:
+            return []
+
+        cluster_ids, labels = np.unique(np.asarray(cluster_labels)[valid_idx], return_inverse=True)
+        n_clusters = len(cluster_ids)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        valid_coordinates = coordinates_2d[valid_idx]
+        centroids_2d = np.stack([
+            np.bincount(labels, weights=valid_coordinates[:, axis], minlength=n_clusters) for axis in range(2)
+        ], axis=1) / sizes[:, np.newaxis]
+
+        # Embedding centroids via a one-hot membership product, then each
+        # point's distance to its centroid summed per cluster
+        membership = sp.csr_matrix(
+            (np.ones(len(labels), dtype=np.float64), (labels, np.arange(len(labels)))),
+            shape=(n_clusters, len(labels))
+        )
+        all_valid = len(valid_idx) == len(features)
+
+        def valid_rows(start):
+            # Plain slices stay zero-copy views when no point was dropped
+            if all_valid:
+                return embeddings_array[start:start + ASSEMBLY_CHUNK_ROWS]
+            return embeddings_array[valid_idx[start:start + ASSEMBLY_CHUNK_ROWS]]
+
+        centroids = np.zeros((n_clusters, embeddings_array.shape[1]))
+        for start in range(0, len(valid_idx), ASSEMBLY_CHUNK_ROWS):
+            centroids += membership[:, start:start + ASSEMBLY_CHUNK_ROWS] @ valid_rows(start)
+        centroids /= sizes[:, np.newaxis]
+        row_centroids = centroids.astype(embeddings_array.dtype)
+        distance_sums = np.zeros(n_clusters)
+        for start in range(0, len(valid_idx), ASSEMBLY_CHUNK_ROWS):
+            chunk_labels = labels[start:start + ASSEMBLY_CHUNK_ROWS]
+            rows = valid_rows(start)
+            distances = np.linalg.norm(rows - row_centroids[chunk_labels], axis=1)
+            distance_sums += np.bincount(chunk_labels, weights=distances, minlength=n_clusters)
+        avg_distances = distance_sums / sizes
+
+        # Field counts per cluster from one-hot (cluster, value) bins
+        def count_values(field, default):
+            values = np.array([str(features[idx].get(field, default)) for idx in valid_idx])
+            categories, codes = np.unique(values, return_inverse=True)
+            counts = np.bincount(labels * len(categories) + codes, minlength=n_clusters * len(categories))
+            return categories, counts.reshape(n_clusters, len(categories))
+
+        priority_values, priority_counts = count_values('Priority', 'Low')
+        customer_types, customer_type_counts = count_values('Customer Type', 'Unknown')
+        is_high = np.isin(np.char.lower(priority_values), ['high', 'critical'])
+        high_priority_counts = priority_counts[:, is_high].sum(axis=1)
+
+        order = np.argsort(labels, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+        coordinate_lists = valid_coordinates.tolist()
+        centroid_lists = centroids_2d.tolist()
+
+        clusters = []
+        for position, cluster_id in enumerate(cluster_ids):
+            members = order[bounds[position]:bounds[position + 1]]
+            priorities = {'Low': 0, 'Medium': 0, 'High': 0, 'Critical': 0}
+            priorities.update({
+                str(priority_values[i]): int(priority_counts[position, i])
+                for i in np.flatnonzero(priority_counts[position])
+            })
+            clusters.append({
+                'id': int(cluster_id),
+                'size': int(sizes[position]),
+                'theme': None,
+                'features': [
+                    {'feature': features[valid_idx[member]], 'coordinates': coordinate_lists[member]}
+                    for member in members
+                ],
+                'centroid': centroid_lists[position],
+                'metadata': {
+                    'high_priority_percentage': float(high_priority_counts[position] / sizes[position] * 100),
+                    'coherence_score': float(1 / (1 + avg_distances[position])),
+                    'avg_distance': float(avg_distances[position]),
+                    'priorities': priorities,
+                    'customer_types': {
+                        str(customer_types[i]): int(customer_type_counts[position, i])
+                        for i in np.flatnonzero(customer_type_counts[position])
+                    }
+                }
+            })
+        return clusters
+
+    @staticmethod
+    def _sort_clusters(clusters: List[Dict[str, Any]]) -> None:
+        # Sort clusters by size and coherence
+        clusters.sort(key=lambda x: (x['size'], x['metadata']['coherence_score']), reverse=True)
+
+    def _label_and_sort(self, clusters: List[Dict[str, Any]], theme_mode: str = None,
+                        on_stage: Callable[[str, Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
+        """Theme assembled clusters and order them by size and coherence.
+
+        With ``on_stage``, hybrid mode reports ``('themes', {'clusters',
+        'source': 'local'})`` with the keyword-themed clusters while the model
+        refines them.
+        """
+        def report_local(labels):
+            local_clusters = [
+                dict(cluster, theme=labels[cluster['id']]['theme'], metadata=dict(
+                    cluster['metadata'],
+                    keywords=labels[cluster['id']]['keywords'],
+                    theme_source=labels[cluster['id']]['source']
+                ))
+                for cluster in clusters
+            ]
+            self._sort_clusters(local_clusters)
+            on_stage('themes', {'clusters': local_clusters, 'source': 'local'})
+
+        labels = self._label_clusters({
+            cluster['id']: [f['feature'] for f in cluster['features']] for cluster in clusters
+        }, theme_mode, report_local if on_stage else None)
+        for cluster in clusters:
+            label = labels[cluster['id']]
+            cluster['theme'] = label['theme']
+            cluster['metadata']['keywords'] = label['keywords']
+            cluster['metadata']['theme_source'] = label['source']
+
+        self._sort_clusters(clusters)
+
+        logger.info(f"Created {len(clusters)} clusters")
+        for cluster in clusters:
+            logger.info(f"Cluster {cluster['id']}: {cluster['theme']} ({cluster['size']} features, coherence: {cluster['metadata']['coherence_score']:.3f})")
+        return clusters
+
+    def recut(self, embedded_features: List[Dict[str, Any]], embeddings: np.ndarray, hierarchy: Dict[str, Any],
+              distance_threshold: float = None, n_clusters: int = None, theme_mode: str = None) -> Dict[str, Any]:
+        """Cut a stored hierarchy at a new threshold or cluster count.
+
+        ``hierarchy`` is the one returned by ``cluster_features`` together with
+        the 2D ``coordinates`` of that analysis, so neither the linkage nor
+        the layout is recomputed. Clusters that already existed keep their
+        cached themes; only newly formed ones are labeled. Returns the clusters
+        and ``labels``, the cluster of each embedded feature.
+
+        An incremental hierarchy only merges its clusters, so it accepts an
+        ``n_clusters`` up to their count and raises ValueError otherwise; its
+        linkage heights are not row distances, so thresholds are rejected too.
+        """
+        if hierarchy['engine'] == 'incremental':
+            finest = len(hierarchy['linkage']) + 1
+            if distance_threshold is not None or n_clusters > finest:
+                raise ValueError(
+                    f"This dataset was clustered incrementally into {finest} clusters, which can only be "
+                    f"merged: re-cut it with n_clusters of at most {finest}, or fetch insights with "
+                    f"recluster=true to rebuild the full hierarchy"
+                )
+
+        features = [feature['feature'] for feature in embedded_features]
+        embeddings_array = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings_array, axis=1)
+        if not np.allclose(norms, 1.0, atol=1e-3):
+            norms[norms == 0] = 1
+            embeddings_array = embeddings_array / norms[:, np.newaxis]
+
+        labels = self.cut_linkage(hierarchy['linkage'], distance_threshold=distance_threshold, n_clusters=n_clusters)
+        if hierarchy.get('leaf_labels') is not None:
+            labels = labels[hierarchy['leaf_labels']]
+
+        clusters = self._assemble_clusters(features, labels, hierarchy['coordinates'], embeddings_array)
+        clusters = self._label_and_sort(clusters, theme_mode)
+        return {
+            'clusters': clusters,
+            'total_features': len(features),
+            'labels': labels
+        }
+
+    def cluster_features(self, embedded_features: List[Dict[str, Any]], embeddings: np.ndarray = None,
+                         engine: str = None, projection_key: str = None, dataset_version: Any = None,
+                         refit_projection: bool = False, projection: str = None,
+                         knn_graph: KnnGraph = None, theme_mode: str = None,
+                         recluster: bool = False,
+                         on_stage: Callable[[str, Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """Cluster feature requests using hierarchical clustering.
+
+        ``embeddings`` is an optional matrix aligned with ``embedded_features``
+        (e.g. a memory-mapped dataset matrix); when omitted the vectors are read
+        from each feature's ``embedding`` entry. ``engine`` forces 'exact' or
+        'scalable' clustering; by default the scalable engine is used above
+        CLUSTERING_SCALABLE_THRESHOLD rows. ``projection_key`` identifies the
+        dataset lineage whose fitted projection and clusters are reused for
+        ``dataset_version``;
+        ``refit_projection`` forces a fresh fit. ``projection`` selects the 2D
+        layout strategy (one of PROJECTION_STRATEGIES, or 'auto' by size).
+        ``knn_graph`` is the dataset's shared neighbour graph; one is built on
+        demand when it is not supplied. ``theme_mode`` overrides THEME_MODE
+        for this call. For a new ``dataset_version`` of a lineage the previous
+        clusters are updated incrementally (see CLUSTERING_INCREMENTAL) unless
+        ``recluster`` forces a full run. ``on_stage`` is called with
+        ``('clusters', {'labels', 'coordinates', 'clusters'})`` once the
+        assignments and layout are known, before the clusters are themed, and
+        in hybrid mode with ``('themes', {'clusters', 'source': 'local'})``
+        once the keyword themes are known, before the model refines them.
+        """
         try:
             logger.info("=== Starting Hierarchical Clustering Process ===")
             
@@ -151,135 +991,108 @@ class ClusteringService:
                 logger.warning("No features to cluster")
                 return {'clusters': [], 'total_features': 0}
 
-            # Extract embeddings and prepare data
-            embeddings = []
-            features = []
-            for feature in embedded_features:
-                if 'embedding' in feature and isinstance(feature['embedding'], (list, np.ndarray)):
-                    embeddings.append(feature['embedding'])
-                    features.append(feature['feature'])
+            if embeddings is not None:
+                features = [feature['feature'] for feature in embedded_features]
+                embeddings_array = np.asarray(embeddings)
+            else:
+                # Extract embeddings and prepare data
+                vectors = []
+                features = []
+                for feature in embedded_features:
+                    if 'embedding' in feature and isinstance(feature['embedding'], (list, np.ndarray)):
+                        vectors.append(feature['embedding'])
+                        features.append(feature['feature'])
+                embeddings_array = np.array(vectors, dtype=np.float32)
 
-            if not embeddings:
+            if len(features) == 0 or embeddings_array.shape[0] != len(features):
                 logger.warning("No valid embeddings found")
                 return {'clusters': [], 'total_features': 0}
 
-            embeddings_array = np.array(embeddings)
-            logger.info(f"Processing {len(embeddings)} feature requests")
+            if embeddings_array.dtype != np.float32:
+                embeddings_array = embeddings_array.astype(np.float32)
+            logger.info(f"Processing {len(features)} feature requests")
 
-            # Normalize embeddings
+            # Normalize embeddings (stored vectors are usually unit length already,
+            # in which case the zero-copy view is used as-is)
             norms = np.linalg.norm(embeddings_array, axis=1)
-            norms[norms == 0] = 1  # Avoid division by zero
-            embeddings_array = embeddings_array / norms[:, np.newaxis]
-
-            # Generate linkage matrix for hierarchical clustering
-            Z = linkage(embeddings_array, method='average', metric='cosine')
-            
-            # Find optimal distance threshold
-            distance_threshold = self._find_optimal_distance_threshold(Z)
-            logger.info(f"Optimal distance threshold: {distance_threshold}")
-
-            # Perform hierarchical clustering
-            clustering = AgglomerativeClustering(
-                n_clusters=None,
-                distance_threshold=distance_threshold,
-                linkage='average',
-                metric='cosine'
-            )
-            
-            try:
-                cluster_labels = clustering.fit_predict(embeddings_array)
-            except Exception as e:
-                logger.error(f"Error in clustering: {str(e)}")
-                # Fallback to a fixed number of clusters
-                clustering = AgglomerativeClustering(n_clusters=5, linkage='ward')
-                cluster_labels = clustering.fit_predict(embeddings_array)
+            if not np.allclose(norms, 1.0, atol=1e-3):
+                norms[norms == 0] = 1  # Avoid division by zero
+                embeddings_array = embeddings_array / norms[:, np.newaxis]
 
-            # Reduce dimensionality for visualization
-            logger.info("Reducing dimensionality with UMAP...")
-            try:
-                coordinates_2d = self.reducer.fit_transform(embeddings_array)
-            except Exception as e:
-                logger.error(f"Error in UMAP reduction: {str(e)}")
-                # Fallback to PCA if UMAP fails
-                from sklearn.decomposition import PCA
-                pca = PCA(n_components=2)
-                coordinates_2d = pca.fit_transform(embeddings_array)
+            text_hashes = [feature.get('text_hash') for feature in embedded_features]
+            lineage_hashes = text_hashes if embeddings is not None and all(text_hashes) else None
 
-            # Organize features into clusters
-            clusters = []
-            unique_labels = set(cluster_labels)
-            
-            for cluster_id in unique_labels:
-                try:
-                    cluster_indices = np.where(cluster_labels == cluster_id)[0]
-                    
-                    if len(cluster_indices) == 0:
-                        continue
-                    
-                    # Get features and coordinates for this cluster
-                    cluster_features = []
-                    valid_coordinates = []
-                    cluster_embeddings = []
-                    
-                    for idx in cluster_indices:
-                        coords = self._ensure_list(coordinates_2d[idx])
-                        if self._validate_coordinates(coords):
-                            cluster_features.append({
-                                'feature': features[idx],
-                                'coordinates': coords
-                            })
-                            valid_coordinates.append(coords)
-                            cluster_embeddings.append(embeddings[idx])
-
-                    if not cluster_features:
-                        continue
-
-                    # Calculate cluster centroid in 2D space
-                    centroid_2d = np.mean(valid_coordinates, axis=0)
-                    
-                    # Extract theme using all features in the cluster
-                    theme = self._extract_cluster_theme(
-                        [f['feature'] for f in cluster_features],
-                        cluster_embeddings
-                    )
-                    
-                    # Calculate cluster coherence
-                    cluster_embeddings_array = np.array(cluster_embeddings)
-                    centroid = np.mean(cluster_embeddings_array, axis=0)
-                    distances = np.linalg.norm(cluster_embeddings_array - centroid, axis=1)
-                    coherence = 1 / (1 + np.mean(distances))
-
-                    # Calculate high priority percentage
-                    high_priority_count = sum(1 for f in cluster_features 
-                                         if f['feature'].get('Priority', '').lower() in ['high', 'critical'])
-                    
-                    clusters.append({
-                        'id': int(cluster_id),
-                        'size': len(cluster_features),
-                        'theme': theme,
-                        'features': cluster_features,
-                        'centroid': self._ensure_list(centroid_2d),
-                        'metadata': {
-                            'high_priority_percentage': (high_priority_count / len(cluster_features)) * 100,
-                            'coherence_score': float(coherence),
-                            'avg_distance': float(np.mean(distances))
-                        }
+            # Runs of the same lineage read and rewrite its stored clusters and
+            # projection, so they are serialized; other lineages run in parallel
+            with self._lineage_lock(projection_key):
+                hierarchy = None
+                state = None
+                if self.incremental and projection_key and lineage_hashes and self.cluster_state_store and not recluster:
+                    state = self.cluster_state_store.load(projection_key)
+                    if state and state.get('version') != dataset_version:
+                        try:
+                            hierarchy = self._incremental_hierarchy(embeddings_array, lineage_hashes, state)
+                        except Exception as e:
+                            logger.error(f"Error in incremental clustering: {str(e)}")
+                if hierarchy is None:
+                    hierarchy = self._build_hierarchy(embeddings_array, engine)
+                if projection_key and lineage_hashes and self.cluster_state_store:
+                    self._save_cluster_state(projection_key, {
+                        'version': dataset_version,
+                        'text_hashes': list(lineage_hashes),
+                        'labels': np.asarray(hierarchy['labels'], dtype=np.int32),
+                        'distance_threshold': hierarchy['distance_threshold'],
+                        'threshold_space': hierarchy['threshold_space'],
+                        'fit_size': state['fit_size'] if hierarchy['engine'] == 'incremental' else len(lineage_hashes),
+                        'changed': hierarchy.get('changed', 0)
                     })
-                except Exception as e:
-                    logger.error(f"Error processing cluster {cluster_id}: {str(e)}")
-                    continue
+                cluster_labels = hierarchy['labels']
+
+                if knn_graph is None:
+                    knn_graph = KnnGraph(embeddings_array, n_neighbors=self.umap_params['n_neighbors'])
 
-            # Sort clusters by size and coherence
-            clusters.sort(key=lambda x: (x['size'], x['metadata']['coherence_score']), reverse=True)
+                # Reduce dimensionality for visualization
+                projection_strategy = self._select_projection(len(features), projection)
+                projection_start = time.perf_counter()
+                coordinates_2d = self._project(
+                    embeddings_array,
+                    lineage_hashes,
+                    projection_key,
+                    dataset_version,
+                    refit_projection,
+                    projection_strategy,
+                    knn_graph
+                )
+                projection_seconds = time.perf_counter() - projection_start
+                logger.info(f"Projection stage ({projection_strategy}) took {projection_seconds:.3f}s")
+
+            # Cluster of each input feature, -1 where it could not be placed
+            feature_labels = np.where(
+                np.isfinite(np.asarray(coordinates_2d, dtype=np.float64).reshape(len(features), -1)).all(axis=1),
+                cluster_labels, -1
+            )
+
+            # Organize features into clusters
+            clusters = self._assemble_clusters(features, cluster_labels, coordinates_2d, embeddings_array)
+            if on_stage:
+                on_stage('clusters', {'labels': feature_labels, 'coordinates': coordinates_2d, 'clusters': clusters})
 
-            logger.info(f"Created {len(clusters)} clusters")
-            for cluster in clusters:
-                logger.info(f"Cluster {cluster['id']}: {cluster['theme']} ({cluster['size']} features, coherence: {cluster['metadata']['coherence_score']:.3f})")
+            clusters = self._label_and_sort(clusters, theme_mode, on_stage)
             logger.info("=== Clustering Complete ===")
 
             return {
                 'clusters': clusters,
-                'total_features': len(embeddings)
+                'total_features': len(features),
+                # Kept for later stages (dendrogram view, re-cuts) so the
+                # hierarchy is only built once per dataset
+                'hierarchy': hierarchy,
+                'coordinates': coordinates_2d,
+                'labels': feature_labels,
+                'knn_graph': knn_graph,
+                'projection': {
+                    'strategy': projection_strategy,
+                    'seconds': round(projection_seconds, 3)
+                }
             }
 
         except Exception as e:
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import time
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+
+from .sqlite_cache import SQLiteCache
+
+# Default bound on stored vectors (~1.2 GB of ada-002 float32 vectors)
+DEFAULT_MAX_ENTRIES = 200000
+
+class EmbeddingCache(SQLiteCache):
+    """Persistent embedding store keyed by (model name, hash of the normalized input text).
+
+    Vectors are kept as float32 blobs in a local SQLite file so embeddings survive
+    restarts and are shared between uploads and contexts. When the store grows past
+    ``max_entries`` the least recently used vectors are evicted.
+    """
+
+    table = 'embeddings'
+
+    def __init__(self, path: str = None, max_entries: int = None):
+        super().__init__(
+            path or os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.db'),
+            max_entries or int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        )
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normalize text so that whitespace-only differences share a cache entry."""
+        return ' '.join(str(text).split())
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Hash normalized text into a stable cache key."""
+        return hashlib.sha256(EmbeddingCache.normalize_text(text).encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return cached float32 embeddings for the given text hashes, marking hits as recently used."""
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        if not hashes:
+            return found
+
+        with self._connect() as conn:
+            for chunk, placeholders in self._chunks(hashes):
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + chunk
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, Union[List[float], np.ndarray]]) -> None:
+        """Store embeddings keyed by text hash and evict old entries if over capacity."""
+        if not embeddings:
+            return
+
+        now = time.time()
+        rows = []
+        for text_hash, embedding in embeddings.items():
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((model, text_hash, int(vector.shape[0]), vector.tobytes(), now))
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict(conn)
@@ -0,0 +1,110 @@
+import os
+from typing import List
+
+import numpy as np
+from openai import OpenAI
+
+DEFAULT_PROVIDER = 'openai'
+DEFAULT_LOCAL_DIMENSIONS = 256
+
+class EmbeddingProvider:
+    """Interface for turning texts into embedding vectors.
+
+    ``model`` names the vector space and namespaces cached embeddings. Remote
+    providers are called through the embedding scheduler and their results are
+    cached; local providers are cheap enough to run directly.
+    """
+
+    name = None
+    model = None
+    remote = True
+    max_batch_inputs = 2048
+    max_batch_tokens = 100000
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, returning one vector per input in the same order."""
+        raise NotImplementedError
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API (text-embedding-ada-002)."""
+
+    name = 'openai'
+    model = 'text-embedding-ada-002'
+    remote = True
+
+    def __init__(self):
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OpenAI API key not found in environment variables")
+        # Retries are handled by the scheduler so back-off is coordinated across
+        # concurrent requests. OPENAI_BASE_URL can point the client at a stub server.
+        self.client = OpenAI(api_key=api_key, base_url=os.getenv('OPENAI_BASE_URL') or None, max_retries=0)
+        self.max_batch_inputs = int(os.getenv('EMBEDDING_BATCH_MAX_INPUTS', self.max_batch_inputs))
+        self.max_batch_tokens = int(os.getenv('EMBEDDING_BATCH_MAX_TOKENS', self.max_batch_tokens))
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=texts
+        )
+        data = sorted(response.data, key=lambda item: item.index)
+        if len(data) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, received {len(data)}")
+        return [item.embedding for item in data]
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """CPU-only embeddings from hashed word n-grams and a fixed random projection.
+
+    The hashing vectorizer and the seeded projection are both stateless, so a
+    text always maps to the same vector regardless of batch or dataset. That
+    keeps local vectors comparable across uploads, unlike a corpus-fitted SVD.
+    """
+
+    name = 'local'
+    remote = False
+    max_batch_inputs = 10000
+    max_batch_tokens = 10000000
+
+    def __init__(self, dimensions: int = None):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.random_projection import SparseRandomProjection
+        import scipy.sparse as sp
+
+        self.dimensions = dimensions or int(os.getenv('LOCAL_EMBEDDING_DIMENSIONS', DEFAULT_LOCAL_DIMENSIONS))
+        self.model = f"local-hashing-{self.dimensions}"
+        self.vectorizer = HashingVectorizer(
+            n_features=2 ** 16,
+            ngram_range=(1, 2),
+            stop_words='english',
+            alternate_sign=False,
+            norm=None
+        )
+        # The projection only depends on the input width and the seed. A denser
+        # projection than the default lets short texts spread over most dimensions.
+        self.projection = SparseRandomProjection(
+            n_components=self.dimensions,
+            density=1 / 16,
+            dense_output=True,
+            random_state=42
+        )
+        self.projection.fit(sp.csr_matrix((1, self.vectorizer.n_features)))
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        counts = self.vectorizer.transform(texts)
+        counts.data = np.log1p(counts.data)  # Sublinear term frequency
+        vectors = np.asarray(self.projection.transform(counts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1
+        return (vectors / norms[:, np.newaxis]).tolist()
+
+PROVIDERS = {
+    OpenAIEmbeddingProvider.name: OpenAIEmbeddingProvider,
+    LocalEmbeddingProvider.name: LocalEmbeddingProvider
+}
+
+def get_embedding_provider(name: str = None) -> EmbeddingProvider:
+    """Instantiate an embedding provider by name (defaults to EMBEDDING_PROVIDER)."""
+    name = (name or os.getenv('EMBEDDING_PROVIDER', DEFAULT_PROVIDER)).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}")
+    return PROVIDERS[name]()
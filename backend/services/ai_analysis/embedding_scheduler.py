@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_MAX_RETRIES = 5
+
+def is_input_error(error: Exception) -> bool:
+    """True for 4xx errors other than 429, which retrying the same request cannot fix."""
+    status = getattr(error, 'status_code', None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+class SchedulerStats:
+    """Thread-safe counters describing a batch of scheduled requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.items = 0
+
+    def record(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'requests': self.requests,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'server_errors': self.server_errors,
+                'items': self.items,
+                'elapsed_seconds': round(elapsed, 3),
+                'items_per_second': round(self.items / elapsed, 2) if elapsed > 0 else 0.0
+            }
+
+class EmbeddingScheduler:
+    """Runs embedding calls concurrently with an adaptive in-flight limit.
+
+    Up to ``max_in_flight`` requests run at once. A 429 halves the allowed
+    concurrency and pauses every caller until the Retry-After delay has passed;
+    sustained successes grow the limit back one request at a time. 5xx and
+    connection errors are retried with jittered exponential back-off.
+    """
+
+    def __init__(self, max_in_flight: int = None, max_retries: int = None,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_in_flight = max(1, max_in_flight or int(os.getenv('EMBEDDING_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('EMBEDDING_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._limit = self.max_in_flight
+        self._in_flight = 0
+        self._successes = 0
+        self._pause_until = 0.0
+
+    def _acquire(self) -> None:
+        """Wait for a free request slot and for any rate-limit pause to pass."""
+        with self._cond:
+            while True:
+                wait = self._pause_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight < self._limit:
+                    self._in_flight += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def _release(self, throttled: bool = False) -> None:
+        """Free a request slot and adjust the concurrency limit (AIMD)."""
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(1, self._limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self._limit and self._limit < self.max_in_flight:
+                    self._limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def _pause(self, delay: float) -> None:
+        """Hold back all callers until ``delay`` seconds from now."""
+        with self._cond:
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Read the server-provided retry delay from an API error, if any."""
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        if not headers:
+            return None
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            value = headers.get('retry-after')
+            if value is None:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            return None
+
+    def _backoff(self, attempt: int) -> float:
+        """Jittered exponential back-off delay for the given retry attempt."""
+        return min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    def call(self, fn: Callable, *args, weight: int = 1, stats: SchedulerStats = None) -> Any:
+        """Run ``fn(*args)`` inside a request slot, retrying 429, 5xx and connection errors."""
+        attempt = 0
+        while True:
+            self._acquire()
+            throttled = False
+            try:
+                self._record(stats, requests=1)
+                result = fn(*args)
+                self._record(stats, succeeded=1, items=weight)
+                return result
+            except Exception as e:
+                status = getattr(e, 'status_code', None)
+                throttled = status == 429
+                retryable = (throttled or (status is not None and status >= 500)
+                             or isinstance(e, openai.APIConnectionError))
+                if throttled:
+                    self._record(stats, throttled=1)
+                elif status is not None and status >= 500:
+                    self._record(stats, server_errors=1)
+
+                if not retryable or attempt >= self.max_retries:
+                    self._record(stats, failed=1)
+                    raise
+
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                attempt += 1
+                self._record(stats, retries=1)
+                print(f"Embedding request failed ({status or type(e).__name__}), retrying in {delay:.1f}s "
+                      f"(attempt {attempt}/{self.max_retries})")
+                if throttled:
+                    self._pause(delay)
+            finally:
+                self._release(throttled)
+
+            if not throttled:
+                time.sleep(delay)
+
+    def _record(self, stats: Optional[SchedulerStats], **counts) -> None:
+        if stats is not None:
+            stats.record(**counts)
+
+    def map(self, fn: Callable, items: List[Any]) -> List[Any]:
+        """Apply ``fn`` to each item on a thread pool sized to the in-flight cap, preserving order."""
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(items))) as executor:
+            return list(executor.map(fn, items))
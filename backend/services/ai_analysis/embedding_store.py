@@ -0,0 +1,154 @@
+import json
+import os
+import pickle
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+class EmbeddingMatrixStore:
+    """Per-dataset embedding matrices kept on disk and loaded with ``np.memmap``.
+
+    Each (dataset, model) pair is stored as a contiguous row-major matrix file
+    plus a JSON index holding the matrix shape, the source row ids and the text
+    hash of every row. Loaded matrices are read-only memory maps, so analyses
+    work on zero-copy views and worker processes share the same pages through
+    the OS page cache. The dataset's kNN graph and cluster hierarchy are cached
+    next to the matrix.
+    """
+
+    def __init__(self, root: str = None, dtype: str = None):
+        self.root = root or os.getenv('EMBEDDING_STORE_DIR', 'embedding_store')
+        self.dtype = (dtype or os.getenv('EMBEDDING_STORE_DTYPE', 'float32')).lower()
+        if self.dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported embedding store dtype: {self.dtype}")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _paths(self, dataset_id: Any, model: str) -> Tuple[str, str]:
+        """Return the matrix and index file paths for a dataset and model."""
+        safe_model = re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        base = os.path.join(self.root, f"{dataset_id}_{safe_model}")
+        return f"{base}.bin", f"{base}.json"
+
+    def save(self, dataset_id: Any, model: str, matrix: np.ndarray,
+             row_ids: List[int], text_hashes: List[str]) -> np.memmap:
+        """Write a matrix and its row index atomically, returning it memory-mapped."""
+        matrix = np.ascontiguousarray(matrix, dtype=self.dtype)
+        matrix_path, index_path = self._paths(dataset_id, model)
+        suffix = f".{uuid.uuid4().hex}.tmp"
+
+        matrix.tofile(matrix_path + suffix)
+        os.replace(matrix_path + suffix, matrix_path)
+
+        index = {
+            'model': model,
+            'dtype': self.dtype,
+            'shape': list(matrix.shape),
+            'row_ids': [int(row_id) for row_id in row_ids],
+            'text_hashes': list(text_hashes)
+        }
+        with open(index_path + suffix, 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + suffix, index_path)
+
+        return np.memmap(matrix_path, dtype=self.dtype, mode='r', shape=matrix.shape)
+
+    def load(self, dataset_id: Any, model: str) -> Optional[Tuple[np.memmap, Dict[str, Any]]]:
+        """Memory-map a stored matrix, returning ``(matrix, index)`` or None when absent."""
+        matrix_path, index_path = self._paths(dataset_id, model)
+        if not os.path.exists(index_path) or not os.path.exists(matrix_path):
+            return None
+
+        with open(index_path) as f:
+            index = json.load(f)
+        shape = tuple(index['shape'])
+        expected_size = int(np.prod(shape)) * np.dtype(index['dtype']).itemsize
+        if os.path.getsize(matrix_path) != expected_size or shape[0] == 0:
+            return None
+
+        matrix = np.memmap(matrix_path, dtype=index['dtype'], mode='r', shape=shape)
+        return matrix, index
+
+    def save_knn(self, dataset_id: Any, model: str, fingerprint: str, indices: np.ndarray,
+                 distances: np.ndarray, search_index: Any = None) -> None:
+        """Cache a kNN graph (and its NN-descent index, if any) for a dataset."""
+        matrix_path, _ = self._paths(dataset_id, model)
+        base = matrix_path[:-len('.bin')]
+        suffix = f".{uuid.uuid4().hex}.tmp"
+
+        if search_index is not None:
+            with open(f"{base}.knn-index.pkl{suffix}", 'wb') as f:
+                pickle.dump(search_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{base}.knn-index.pkl{suffix}", f"{base}.knn-index.pkl")
+        elif os.path.exists(f"{base}.knn-index.pkl"):
+            os.remove(f"{base}.knn-index.pkl")
+
+        # np.savez appends .npz to names that lack it
+        np.savez(f"{base}.knn{suffix}.npz", indices=indices, distances=distances,
+                 fingerprint=np.array(fingerprint), has_index=np.array(search_index is not None))
+        os.replace(f"{base}.knn{suffix}.npz", f"{base}.knn.npz")
+
+    def load_knn(self, dataset_id: Any, model: str, fingerprint: str):
+        """Return a cached ``(indices, distances, search_index)`` graph built over the same rows, or None."""
+        matrix_path, _ = self._paths(dataset_id, model)
+        base = matrix_path[:-len('.bin')]
+        if not os.path.exists(f"{base}.knn.npz"):
+            return None
+
+        with np.load(f"{base}.knn.npz") as data:
+            if str(data['fingerprint']) != fingerprint:
+                return None
+            indices, distances = data['indices'], data['distances']
+            has_index = bool(data['has_index'])
+
+        search_index = None
+        if has_index:
+            if not os.path.exists(f"{base}.knn-index.pkl"):
+                return None
+            with open(f"{base}.knn-index.pkl", 'rb') as f:
+                search_index = pickle.load(f)
+        return indices, distances, search_index
+
+    def save_hierarchy(self, dataset_id: Any, model: str, fingerprint: str, hierarchy: Dict[str, Any],
+                       coordinates: np.ndarray) -> None:
+        """Persist a dataset's cluster hierarchy and 2D layout so it can be re-cut later."""
+        matrix_path, _ = self._paths(dataset_id, model)
+        base = matrix_path[:-len('.bin')]
+        suffix = f".{uuid.uuid4().hex}.tmp"
+
+        leaf_labels = hierarchy.get('leaf_labels')
+        np.savez(
+            f"{base}.hierarchy{suffix}.npz",
+            fingerprint=np.array(fingerprint),
+            engine=np.array(hierarchy['engine']),
+            dimensions=np.array(hierarchy.get('dimensions', 0)),
+            linkage=hierarchy['linkage'],
+            leaf_labels=leaf_labels if leaf_labels is not None else np.empty(0, dtype=np.int64),
+            distance_threshold=np.array(hierarchy['distance_threshold']),
+            labels=hierarchy['labels'],
+            coordinates=np.asarray(coordinates, dtype=np.float64)
+        )
+        os.replace(f"{base}.hierarchy{suffix}.npz", f"{base}.hierarchy.npz")
+
+    def load_hierarchy(self, dataset_id: Any, model: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return the stored hierarchy (with its 'coordinates') for the same rows, or None."""
+        matrix_path, _ = self._paths(dataset_id, model)
+        base = matrix_path[:-len('.bin')]
+        if not os.path.exists(f"{base}.hierarchy.npz"):
+            return None
+
+        with np.load(f"{base}.hierarchy.npz") as data:
+            if str(data['fingerprint']) != fingerprint:
+                return None
+            return {
+                'engine': str(data['engine']),
+                'dimensions': int(data['dimensions']),
+                'linkage': data['linkage'],
+                'leaf_labels': data['leaf_labels'] if len(data['leaf_labels']) else None,
+                'distance_threshold': float(data['distance_threshold']),
+                'labels': data['labels'],
+                'coordinates': data['coordinates']
+            }
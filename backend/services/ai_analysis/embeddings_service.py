@@ -1,56 +1,241 @@
-import openai
-from openai import OpenAI
 import os
+import threading
 from typing import List, Dict, Any
+import numpy as np
 from dotenv import load_dotenv
 import traceback
+from .embedding_cache import EmbeddingCache
+from .embedding_scheduler import EmbeddingScheduler, SchedulerStats, is_input_error
+from .embedding_providers import EmbeddingProvider, get_embedding_provider, DEFAULT_PROVIDER
+from .embedding_store import EmbeddingMatrixStore
 
 class EmbeddingsService:
-    def __init__(self):
+    def __init__(self, provider: str = None):
         load_dotenv()
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OpenAI API key not found in environment variables")
-        self.client = OpenAI(api_key=api_key)
+        self.default_provider = (provider or os.getenv('EMBEDDING_PROVIDER', DEFAULT_PROVIDER)).lower()
+        self._providers = {}
+        self._providers_lock = threading.Lock()
+        # Fail fast when the deployment's default provider is misconfigured
+        self.get_provider(self.default_provider)
+        self.scheduler = EmbeddingScheduler()
+        try:
+            self.cache = EmbeddingCache()
+        except Exception as e:
+            print(f"Warning: Embedding cache unavailable: {str(e)}")
+            self.cache = None
+        try:
+            self.store = EmbeddingMatrixStore()
+        except Exception as e:
+            print(f"Warning: Embedding matrix store unavailable: {str(e)}")
+            self.store = None
+
+    def get_provider(self, name: str = None) -> EmbeddingProvider:
+        """Return the named embedding provider, creating it on first use."""
+        name = (name or self.default_provider).lower()
+        with self._providers_lock:
+            if name not in self._providers:
+                self._providers[name] = get_embedding_provider(name)
+            return self._providers[name]
+
+    def _estimate_tokens(self, text: str) -> int:
+        """Roughly estimate the token count of a text (about 4 characters per token)."""
+        return len(text) // 4 + 1
+
+    def _build_batches(self, items: List[Dict[str, Any]], provider: EmbeddingProvider) -> List[List[Dict[str, Any]]]:
+        """Pack items into batches bounded by input count and estimated tokens."""
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for item in items:
+            tokens = self._estimate_tokens(item['description'])
+            if current and (len(current) >= provider.max_batch_inputs or
+                            current_tokens + tokens > provider.max_batch_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch(self, batch: List[Dict[str, Any]], provider: EmbeddingProvider,
+                     stats: SchedulerStats = None) -> List[Dict[str, Any]]:
+        """Embed a batch, splitting it in halves when the API rejects its input.
 
-    def embed_features(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate embeddings for feature request descriptions."""
+        Throttling, server and connection errors are raised once the scheduler
+        has run out of retries; splitting would only multiply the traffic.
+        """
+        try:
+            texts = [item['description'] for item in batch]
+            if provider.remote:
+                embeddings = self.scheduler.call(provider.embed, texts, weight=len(batch), stats=stats)
+            else:
+                embeddings = provider.embed(texts)
+            for item, embedding in zip(batch, embeddings):
+                item['embedding'] = embedding
+            return batch
+        except Exception as e:
+            if provider.remote and not is_input_error(e):
+                raise
+            if len(batch) == 1:
+                title = batch[0]['feature'].get('Feature Title', 'Unknown')
+                print(f"Error generating embedding for {title}: {str(e)}")
+                return []
+
+            print(f"Error embedding batch of {len(batch)} inputs: {str(e)}. Retrying in smaller batches")
+            middle = len(batch) // 2
+            return (self._embed_batch(batch[:middle], provider, stats) +
+                    self._embed_batch(batch[middle:], provider, stats))
+
+    def _lookup_cached(self, provider: EmbeddingProvider, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached embeddings, treating cache errors as misses."""
+        if not self.cache or not provider.remote:
+            return {}
+        try:
+            return self.cache.get_many(provider.model, hashes)
+        except Exception as e:
+            print(f"Warning: Error reading embedding cache: {str(e)}")
+            return {}
+
+    def _store_cached(self, provider: EmbeddingProvider, embeddings: Dict[str, List[float]]) -> None:
+        """Persist newly generated embeddings, ignoring cache errors."""
+        if not self.cache or not provider.remote:
+            return
+        try:
+            self.cache.put_many(provider.model, embeddings)
+        except Exception as e:
+            print(f"Warning: Error writing embedding cache: {str(e)}")
+
+    def _load_stored(self, dataset_id: Any, provider: EmbeddingProvider):
+        """Memory-map a dataset's stored embedding matrix, or return None."""
+        if dataset_id is None or not self.store:
+            return None
+        try:
+            return self.store.load(dataset_id, provider.model)
+        except Exception as e:
+            print(f"Warning: Error loading stored embeddings: {str(e)}")
+            return None
+
+    def _save_stored(self, dataset_id: Any, provider: EmbeddingProvider, matrix: np.ndarray,
+                     items: List[Dict[str, Any]]) -> np.ndarray:
+        """Persist a dataset's embedding matrix and return the memory-mapped copy."""
+        if dataset_id is None or not self.store:
+            return matrix
+        try:
+            return self.store.save(
+                dataset_id,
+                provider.model,
+                matrix,
+                [item['row'] for item in items],
+                [item['text_hash'] for item in items]
+            )
+        except Exception as e:
+            print(f"Warning: Error saving stored embeddings: {str(e)}")
+            return matrix
+
+    def embed_features(self, features: List[Dict[str, Any]], provider: str = None,
+                       dataset_id: Any = None) -> Dict[str, Any]:
+        """Generate embeddings for feature request descriptions.
+
+        Returns the embedded features (with their row position in ``features``)
+        and an aligned float matrix under ``embeddings``. When ``dataset_id`` is
+        given the matrix is persisted per dataset and returned as a read-only
+        memory map, so repeated analyses of the same upload skip embedding.
+        """
+        embedding_provider = self.get_provider(provider)
         try:
             print("\n=== Generating Embeddings ===")
-            embedded_features = []
-            
-            for feature in features:
+            print(f"Using embedding provider: {embedding_provider.name} ({embedding_provider.model})")
+            items = []
+
+            for row, feature in enumerate(features):
                 # Extract description
-                description = feature.get('Description', '').strip()
+                description = EmbeddingCache.normalize_text(feature.get('Description', ''))
                 if not description:
                     print(f"Warning: Empty description for feature {feature.get('Feature Title', 'Unknown')}")
                     continue
 
-                # Get embedding for description
-                try:
-                    print(f"Generating embedding for: {feature.get('Feature Title', 'Unknown')}")
-                    response = self.client.embeddings.create(
-                        model="text-embedding-ada-002",
-                        input=description
-                    )
-                    embedding = response.data[0].embedding
-                    
-                    embedded_features.append({
-                        'feature': feature,
-                        'description': description,
-                        'embedding': embedding
-                    })
-                    print(f"Successfully generated embedding for: {feature.get('Feature Title', 'Unknown')}")
-                except Exception as e:
-                    print(f"Error generating embedding: {str(e)}")
-                    continue
+                items.append({
+                    'feature': feature,
+                    'description': description,
+                    'row': row,
+                    'text_hash': EmbeddingCache.text_hash(description)
+                })
+
+            run_stats = None
+            stored = self._load_stored(dataset_id, embedding_provider)
+            if stored and stored[1]['row_ids'] == [item['row'] for item in items] \
+                    and stored[1]['text_hashes'] == [item['text_hash'] for item in items]:
+                print(f"Using stored embedding matrix for dataset {dataset_id}")
+                matrix = stored[0]
+            else:
+                embeddings = {}
+                if stored:
+                    # Rows unchanged since the matrix was written are reused as-is
+                    stored_matrix, index = stored
+                    for position, text_hash in enumerate(index['text_hashes']):
+                        embeddings.setdefault(text_hash, stored_matrix[position])
+
+                # Reuse embeddings we already paid for; only unseen text goes to the API
+                embeddings.update(self._lookup_cached(
+                    embedding_provider,
+                    [item['text_hash'] for item in items if item['text_hash'] not in embeddings]
+                ))
+                pending = {}
+                for item in items:
+                    if item['text_hash'] not in embeddings:
+                        pending.setdefault(item['text_hash'], dict(item))
+                print(f"Found {len(items) - len(pending)} existing embeddings, {len(pending)} new texts to embed")
+
+                batches = self._build_batches(list(pending.values()), embedding_provider)
+                print(f"Embedding {len(pending)} descriptions in {len(batches)} batches")
+
+                stats = SchedulerStats()
+                new_embeddings = {}
+                embedded_batches = self.scheduler.map(
+                    lambda batch: self._embed_batch(batch, embedding_provider, stats),
+                    batches
+                )
+                for embedded_batch in embedded_batches:
+                    for item in embedded_batch:
+                        new_embeddings[item['text_hash']] = item['embedding']
+                run_stats = stats.to_dict()
+                print(f"Embedding requests: {run_stats}")
+                self._store_cached(embedding_provider, new_embeddings)
+                embeddings.update(new_embeddings)
+
+                items = [item for item in items if item['text_hash'] in embeddings]
+                if items:
+                    matrix = np.empty((len(items), len(embeddings[items[0]['text_hash']])), dtype=np.float32)
+                    for position, item in enumerate(items):
+                        matrix[position] = embeddings[item['text_hash']]
+                    matrix = self._save_stored(dataset_id, embedding_provider, matrix, items)
+                else:
+                    matrix = np.empty((0, 0), dtype=np.float32)
+
+            embedded_features = [
+                {
+                    'feature': item['feature'],
+                    'description': item['description'],
+                    'row': item['row'],
+                    'text_hash': item['text_hash']
+                }
+                for item in items
+            ]
 
             print(f"Generated {len(embedded_features)} embeddings")
             print("=== Embedding Generation Complete ===\n")
-            
+
             return {
                 'embedded_features': embedded_features,
-                'total_features': len(embedded_features)
+                'embeddings': matrix,
+                'total_features': len(embedded_features),
+                'provider': embedding_provider.name,
+                'model': embedding_provider.model,
+                'stats': run_stats
             }
 
         except Exception as e:
@@ -58,5 +243,6 @@ class EmbeddingsService:
             print(f"Traceback: {traceback.format_exc()}")
             return {
                 'embedded_features': [],
+                'embeddings': np.empty((0, 0), dtype=np.float32),
                 'total_features': 0
-            } 
\ No newline at end of file
+            }
@@ -1,10 +1,18 @@
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import Any, Callable, Dict, List
 import pandas as pd
 from .embeddings_service import EmbeddingsService
 from .clustering_service import ClusteringService
+from .knn_graph import KnnGraph, graph_fingerprint
+from .aggregates import FeatureAggregates
 import numpy as np
+import os
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+DEFAULT_STAGE_WORKERS = 4
+DEFAULT_CLUSTERING_WORKERS = 2
+DEFAULT_CLUSTERING_TIMEOUT = 0
 
 class FeatureAnalyzer:
     """Main service for analyzing feature requests using AI."""
@@ -13,9 +21,57 @@ class FeatureAnalyzer:
         """Initialize the feature analyzer with required services."""
         self.embeddings_service = EmbeddingsService()
         self.clustering_service = ClusteringService()
+        # The tabular summaries run on this pool alongside embedding and
+        # clustering; nothing else is queued on it, so they never wait
+        # behind a slow clustering branch
+        self.stage_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv('ANALYSIS_STAGE_WORKERS', DEFAULT_STAGE_WORKERS)),
+            thread_name_prefix='analysis-stage'
+        )
+        # Seconds to wait for embedding and clustering; 0 waits indefinitely.
+        # With a timeout the branch runs on its own pool so it can be abandoned.
+        self.clustering_timeout = float(os.getenv('ANALYSIS_CLUSTERING_TIMEOUT', DEFAULT_CLUSTERING_TIMEOUT))
+        self.clustering_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv('ANALYSIS_CLUSTERING_WORKERS', DEFAULT_CLUSTERING_WORKERS)),
+            thread_name_prefix='analysis-clustering'
+        )
+
+    def analyze_features(self, features: List[Dict[str, Any]], embedding_provider: str = None,
+                         dataset_id: Any = None, context_id: Any = None,
+                         refit_projection: bool = False, projection: str = None,
+                         theme_mode: str = None, recluster: bool = False,
+                         on_stage: Callable[[str, Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """Perform comprehensive analysis of feature requests.
+
+        ``embedding_provider`` selects the embedding backend for this call
+        (e.g. 'openai' or 'local'); the service default is used when omitted.
+        ``dataset_id`` identifies the stored upload so its embedding matrix can
+        be persisted and memory-mapped on later analyses. ``context_id`` keys
+        the fitted 2D projection reused across uploads of the same context;
+        ``refit_projection`` forces it to be refitted and ``projection`` picks
+        the 2D layout strategy (see ClusteringService.PROJECTION_STRATEGIES).
+        ``theme_mode`` picks how clusters are themed ('llm', 'local' or 'hybrid').
+        A new upload of a context updates the previous upload's clusters
+        incrementally; ``recluster`` forces clustering from scratch.
+
+        The tabular summaries run concurrently with embedding and clustering
+        and are returned even when that branch fails, produces no clusters or
+        exceeds ANALYSIS_CLUSTERING_TIMEOUT; such results carry a
+        ``clustering_error``. A timed-out branch that has not started is
+        cancelled; one already running cannot be interrupted and keeps its
+        ANALYSIS_CLUSTERING_WORKERS worker until it finishes.
 
-    def analyze_features(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Perform comprehensive analysis of feature requests."""
+        ``on_stage(stage, payload)`` receives each part of the result as soon
+        as it is ready: 'aggregates' (the tabular summaries), 'clusters' (the
+        cluster of every row, -1 when unclustered, its 2D coordinates and
+        cluster sizes and centroids), 'themes' (the themed clusters and most
+        common requests) and 'pain_points'. In hybrid theme mode 'themes'
+        arrives twice: first with ``source: 'local'`` carrying the keyword
+        themes, then with ``source: 'final'`` once the model has refined
+        them; otherwise it arrives once as 'final'. The complete result is
+        returned as before, with the 'clusters' payload kept under
+        ``cluster_layout``.
+        """
         try:
             print("\n=== Starting Feature Analysis ===")
             
@@ -26,56 +82,55 @@ class FeatureAnalyzer:
             # Convert to DataFrame for easier manipulation
             df = pd.DataFrame(features)
             print(f"Processing {len(features)} features")
-            
-            # Generate embeddings
-            print("Generating embeddings...")
-            embedded_data = self.embeddings_service.embed_features(features)
-            if not embedded_data['embedded_features']:
-                print("No embeddings generated")
-                return self._empty_result()
-            
-            print(f"Generated {len(embedded_data['embedded_features'])} embeddings")
-            
-            # Perform clustering
-            print("Performing clustering...")
-            cluster_results = self.clustering_service.cluster_features(
-                embedded_data['embedded_features']
-            )
-            
-            if not cluster_results['clusters']:
-                print("No clusters generated")
-                return self._empty_result()
-            
-            print(f"Created {len(cluster_results['clusters'])} clusters")
-            
-            # Process clusters
-            clusters = []
-            for cluster in cluster_results['clusters']:
-                cluster_features = cluster['features']
-                if not cluster_features:
-                    continue
-                    
-                # Calculate cluster metadata
-                metadata = self._calculate_cluster_metadata(cluster_features)
-                
-                clusters.append({
-                    'id': cluster['id'],
-                    'theme': cluster['theme'],
-                    'size': len(cluster_features),
-                    'features': cluster_features,
-                    'metadata': metadata
-                })
-            
-            result = {
+
+            # The tabular summaries do not need embeddings, so they run
+            # alongside the embedding and clustering branch
+            aggregates_future = self.stage_pool.submit(self._aggregate_stage, df)
+            if on_stage:
+                def report_aggregates(future):
+                    if future.exception() is None:
+                        self._emit(on_stage, 'aggregates', future.result()[1])
+                aggregates_future.add_done_callback(report_aggregates)
+
+            clustering, clustering_error, clustering_future = None, None, None
+            try:
+                cluster_args = (features, embedding_provider, dataset_id, context_id,
+                                refit_projection, projection, theme_mode, recluster, on_stage)
+                if self.clustering_timeout:
+                    clustering_future = self.clustering_pool.submit(self._clustering_stage, *cluster_args)
+                    clustering = clustering_future.result(timeout=self.clustering_timeout)
+                else:
+                    clustering = self._clustering_stage(*cluster_args)
+            except FuturesTimeoutError:
+                # A branch still queued behind earlier timed-out ones never starts
+                started = not clustering_future.cancel()
+                clustering_error = f"Clustering timed out after {self.clustering_timeout}s" + \
+                    ('' if started else ' before it started')
+                print(clustering_error)
+            except Exception as e:
+                clustering_error = f"Clustering failed: {str(e)}"
+                print(clustering_error)
+                print(traceback.format_exc())
+
+            aggregates, summaries = aggregates_future.result()
+            result = self._empty_result()
+            result.update(summaries)
+
+            if clustering is None:
+                # Keep the summaries, but flag the result so it is not cached
+                result['clustering_error'] = clustering_error or 'No clusters generated'
+                print("=== Feature Analysis Complete (without clusters) ===\n")
+                return result
+
+            cluster_results, clusters, row_labels, cluster_layout = clustering
+            result.update({
                 'clusters': clusters,
+                'cluster_layout': cluster_layout,
                 'most_common_requests': self._get_common_requests(cluster_results),
-                'top_pain_points': self._analyze_pain_points(df, clusters),
-                'most_engaged_customers': self._analyze_customer_engagement(df),
-                'requests_by_category': self._get_requests_by_category(df),
-                'trends_over_time': self._analyze_temporal_patterns(df)['trends'],
-                'requests_by_customer_type': self._get_requests_by_customer_type(df),
-                'average_priority_score': self._calculate_priority_score(df)
-            }
+                'top_pain_points': self._analyze_pain_points(aggregates, clusters, row_labels),
+                'projection': cluster_results.get('projection')
+            })
+            self._emit(on_stage, 'pain_points', {'top_pain_points': result['top_pain_points']})
             
             print("\n=== Analysis Results ===")
             print(f"Number of clusters: {len(result['clusters'])}")
@@ -89,35 +144,234 @@ class FeatureAnalyzer:
             print(traceback.format_exc())
             return self._empty_result()
 
-    def _calculate_cluster_metadata(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Calculate metadata for a cluster."""
+    def _aggregate_stage(self, df: pd.DataFrame):
+        """Compute the embedding-independent summaries of an upload."""
+        aggregates = FeatureAggregates(df)
+        return aggregates, aggregates.summarize()
+
+    def _clustering_stage(self, features: List[Dict[str, Any]], embedding_provider: str, dataset_id: Any,
+                          context_id: Any, refit_projection: bool, projection: str, theme_mode: str,
+                          recluster: bool, on_stage: Callable[[str, Dict[str, Any]], None] = None):
+        """Embed and cluster the features.
+
+        Returns ``(cluster_results, clusters, row_labels, cluster_layout)``,
+        or None when no embeddings or clusters could be produced.
+        """
+        # Generate embeddings
+        print("Generating embeddings...")
+        embedded_data = self.embeddings_service.embed_features(
+            features,
+            provider=embedding_provider,
+            dataset_id=dataset_id
+        )
+        if not embedded_data['embedded_features']:
+            print("No embeddings generated")
+            return None
+        
+        print(f"Generated {len(embedded_data['embedded_features'])} embeddings")
+        
+        # One neighbour graph per dataset, shared by the projection stages
+        # and cached next to the stored embeddings
+        fingerprint = graph_fingerprint([f['text_hash'] for f in embedded_data['embedded_features']])
+        knn_graph = KnnGraph(
+            embedded_data['embeddings'],
+            n_neighbors=self.clustering_service.umap_params['n_neighbors'],
+            store=self.embeddings_service.store,
+            dataset_id=dataset_id,
+            model=embedded_data['model'],
+            fingerprint=fingerprint
+        )
+
+        rows = np.array([f['row'] for f in embedded_data['embedded_features']], dtype=np.int64)
+
+        def report_clusters(stage: str, data: Dict[str, Any]) -> None:
+            if stage == 'themes':
+                # Keyword themes reported while the model refines them
+                local_results = {'clusters': data['clusters']}
+                self._emit(on_stage, stage, {
+                    'clusters': self._format_clusters(local_results),
+                    'most_common_requests': self._get_common_requests(local_results),
+                    'source': data['source']
+                })
+                return
+            self._emit(on_stage, stage, self._cluster_layout(len(features), rows, data))
+
+        # Perform clustering
+        print("Performing clustering...")
+        cluster_results = self.clustering_service.cluster_features(
+            embedded_data['embedded_features'],
+            embedded_data['embeddings'],
+            projection_key=f"{context_id}_{embedded_data['model']}" if context_id is not None else None,
+            dataset_version=dataset_id,
+            refit_projection=refit_projection,
+            projection=projection,
+            knn_graph=knn_graph,
+            theme_mode=theme_mode,
+            recluster=recluster,
+            on_stage=report_clusters if on_stage else None
+        )
+        
+        if not cluster_results['clusters']:
+            print("No clusters generated")
+            return None
+        
+        print(f"Created {len(cluster_results['clusters'])} clusters")
+        
+        # Keep the hierarchy and layout so the dataset can be re-cut instantly
+        self._save_hierarchy(dataset_id, embedded_data['model'], fingerprint, cluster_results)
+
+        # Process clusters
+        clusters = self._format_clusters(cluster_results)
+        self._emit(on_stage, 'themes', {
+            'clusters': clusters,
+            'most_common_requests': self._get_common_requests(cluster_results),
+            'source': 'final'
+        })
+        row_labels = np.full(len(features), -1, dtype=np.int64)
+        row_labels[rows] = cluster_results.get('labels', -1)
+        return cluster_results, clusters, row_labels, self._cluster_layout(len(features), rows, cluster_results)
+
+    def _cluster_layout(self, n_rows: int, rows: np.ndarray, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map clustering labels and 2D coordinates back to the rows of the upload.
+
+        This is the payload of the 'clusters' stage, also kept in the result
+        as ``cluster_layout`` so a cached analysis can replay it.
+        """
+        labels = np.full(n_rows, -1, dtype=np.int64)
+        labels[rows] = data['labels']
+        coordinates = [None] * n_rows
+        for row, label, point in zip(rows.tolist(), np.asarray(data['labels']).tolist(),
+                                     np.asarray(data['coordinates']).tolist()):
+            if label >= 0:
+                coordinates[row] = point
+        return {
+            'labels': labels.tolist(),
+            'coordinates': coordinates,
+            'clusters': [
+                {'id': cluster['id'], 'size': cluster['size'], 'centroid': cluster['centroid']}
+                for cluster in data['clusters']
+            ]
+        }
+
+    def _emit(self, on_stage: Callable[[str, Dict[str, Any]], None], stage: str, payload: Dict[str, Any]) -> None:
+        """Report a finished stage; a failing listener never fails the analysis."""
+        if on_stage is None:
+            return
+        try:
+            on_stage(stage, payload)
+        except Exception as e:
+            print(f"Error reporting {stage} stage: {str(e)}")
+
+    def _format_clusters(self, cluster_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Shape clustering output into the clusters returned to the client."""
+        clusters = []
+        for cluster in cluster_results['clusters']:
+            cluster_features = cluster['features']
+            if not cluster_features:
+                continue
+
+            # Calculate cluster metadata
+            metadata = self._calculate_cluster_metadata(cluster)
+            metadata['keywords'] = cluster['metadata'].get('keywords', [])
+            metadata['theme_source'] = cluster['metadata'].get('theme_source')
+
+            clusters.append({
+                'id': cluster['id'],
+                'theme': cluster['theme'],
+                'size': len(cluster_features),
+                'features': cluster_features,
+                'metadata': metadata
+            })
+        return clusters
+
+    def _save_hierarchy(self, dataset_id: Any, model: str, fingerprint: str, cluster_results: Dict[str, Any]) -> None:
+        """Persist the dataset's hierarchy and 2D layout next to its embeddings."""
+        store = self.embeddings_service.store
+        hierarchy = cluster_results.get('hierarchy')
+        if store is None or dataset_id is None or hierarchy is None or hierarchy['linkage'] is None:
+            return
         try:
-            total = len(features)
+            store.save_hierarchy(
+                dataset_id,
+                model,
+                fingerprint,
+                hierarchy,
+                cluster_results['coordinates']
+            )
+        except Exception as e:
+            print(f"Warning: Error saving cluster hierarchy: {str(e)}")
+
+    def recut_clusters(self, features: List[Dict[str, Any]], dataset_id: Any, embedding_provider: str = None,
+                       distance_threshold: float = None, n_clusters: int = None,
+                       theme_mode: str = None) -> Dict[str, Any]:
+        """Re-cut a dataset's stored hierarchy without re-running the analysis.
+
+        Requires a previous ``analyze_features`` run for the same dataset and
+        provider: the embedding matrix and hierarchy are read from the
+        embedding store, and nothing is embedded. Returns the clusters, the
+        most common requests and ``labels``, the cluster of every input row
+        (-1 for rows that were not embedded), or a dict with an ``error``
+        when either is not stored or the hierarchy cannot be cut as asked.
+        """
+        start = time.perf_counter()
+        store = self.embeddings_service.store
+        if store is None:
+            return {'error': 'Embedding store unavailable', 'clusters': []}
+
+        model = self.embeddings_service.get_provider(embedding_provider).model
+        stored = store.load(dataset_id, model)
+        if stored is None or max(stored[1]['row_ids'], default=-1) >= len(features):
+            return {'error': 'No stored embeddings for this dataset; fetch insights first', 'clusters': []}
+        matrix, index = stored
+
+        hierarchy = store.load_hierarchy(dataset_id, model, graph_fingerprint(index['text_hashes']))
+        if hierarchy is None:
+            return {'error': 'No stored hierarchy for this dataset; fetch insights first', 'clusters': []}
+
+        embedded_features = [
+            {'feature': features[row], 'row': row, 'text_hash': text_hash}
+            for row, text_hash in zip(index['row_ids'], index['text_hashes'])
+        ]
+        try:
+            cluster_results = self.clustering_service.recut(
+                embedded_features,
+                matrix,
+                hierarchy,
+                distance_threshold=distance_threshold,
+                n_clusters=n_clusters,
+                theme_mode=theme_mode
+            )
+        except ValueError as e:
+            return {'error': str(e), 'clusters': []}
+
+        labels = np.full(len(features), -1, dtype=np.int64)
+        labels[[f['row'] for f in embedded_features]] = cluster_results['labels']
+
+        return {
+            'clusters': self._format_clusters(cluster_results),
+            'most_common_requests': self._get_common_requests(cluster_results),
+            'labels': labels.tolist(),
+            'distance_threshold': distance_threshold,
+            'n_clusters': len(cluster_results['clusters']),
+            'seconds': round(time.perf_counter() - start, 3)
+        }
+
+    def _calculate_cluster_metadata(self, cluster: Dict[str, Any]) -> Dict[str, Any]:
+        """Calculate metadata for a cluster from the counts gathered during clustering."""
+        try:
+            total = cluster['size']
             if total == 0:
                 return self._empty_metadata()
-                
-            priorities = {'Low': 0, 'Medium': 0, 'High': 0, 'Critical': 0}
-            customer_types = {}
-            
-            for feature in features:
-                # Count priorities
-                priority = feature['feature'].get('Priority', 'Low')
-                priorities[priority] = priorities.get(priority, 0) + 1
-                
-                # Count customer types
-                cust_type = feature['feature'].get('Customer Type', 'Unknown')
-                customer_types[cust_type] = customer_types.get(cust_type, 0) + 1
-            
-            # Calculate percentages
-            high_priority = (priorities['High'] + priorities['Critical'])
-            high_priority_percentage = (high_priority / total) * 100 if total > 0 else 0
-            
+
+            priorities = cluster['metadata']['priorities']
+            high_priority = priorities.get('High', 0) + priorities.get('Critical', 0)
+
             return {
                 'priorities': priorities,
-                'customer_types': customer_types,
-                'high_priority_percentage': high_priority_percentage
+                'customer_types': cluster['metadata']['customer_types'],
+                'high_priority_percentage': (high_priority / total) * 100
             }
-            
+
         except Exception as e:
             print(f"Error calculating cluster metadata: {str(e)}")
             return self._empty_metadata()
@@ -163,37 +417,33 @@ class FeatureAnalyzer:
             print(f"Error getting common requests: {str(e)}")
             return []
     
-    def _analyze_pain_points(self, df: pd.DataFrame, clusters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Identify top pain points using clustering and priority analysis."""
+    def _analyze_pain_points(self, aggregates: FeatureAggregates, clusters: List[Dict[str, Any]],
+                             row_labels: np.ndarray) -> List[Dict[str, Any]]:
+        """Identify top pain points using clustering and priority analysis.
+
+        ``row_labels`` holds the cluster id of each row (-1 when the
+        row is not in a cluster), so every cluster's impact comes from a
+        single groupby over the scored rows.
+        """
         try:
-            if df.empty or not clusters:
+            if not aggregates.n_rows or not clusters:
                 print("No data available for pain points analysis")
                 return []
 
             # Combine priority and impact information
-            df['impact_score'] = df.apply(
-                lambda row: self._calculate_impact_score(
-                    row.get('Priority', 'Low'),
-                    row.get('Customer Impact', 'Low'),
-                    row.get('Business Value', 'Low')
-                ),
-                axis=1
-            )
-            
+            scores = pd.DataFrame({
+                'cluster_id': row_labels,
+                'impact_score': self._calculate_impact_scores(aggregates)
+            })
+            impact = scores[scores['cluster_id'] >= 0].groupby('cluster_id')['impact_score'].mean()
+
             # Group high-impact issues by cluster
-            high_impact_clusters = []
-            for cluster in clusters:
-                cluster_features = [f['feature'] for f in cluster['features']]
-                cluster_df = df[df['Feature Title'].isin([f['Feature Title'] for f in cluster_features])]
-                
-                if len(cluster_df) > 0:
-                    avg_impact = cluster_df['impact_score'].mean()
-                    if avg_impact >= 0.7:  # High impact threshold
-                        high_impact_clusters.append({
-                            'name': cluster['theme'],
-                            'impact_score': avg_impact,
-                            'count': len(cluster_df)
-                        })
+            themes = {cluster['id']: cluster['theme'] for cluster in clusters}
+            high_impact = impact[(impact >= 0.7) & impact.index.isin(list(themes))]  # High impact threshold
+            high_impact_clusters = [
+                {'name': themes[cluster_id], 'impact_score': avg_impact}
+                for cluster_id, avg_impact in high_impact.items()
+            ]
             
             # Sort by impact score
             high_impact_clusters.sort(key=lambda x: x['impact_score'], reverse=True)
@@ -217,136 +467,22 @@ class FeatureAnalyzer:
             print(f"Error analyzing pain points: {str(e)}")
             return []
     
-    def _calculate_impact_score(self, priority: str, impact: str, value: str) -> float:
-        """Calculate normalized impact score from priority, impact, and business value."""
-        try:
-            # Convert string values to numeric scores
-            priority_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8, 'Critical': 1.0}
-            impact_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8}
-            value_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8}
-            
-            # Get numeric scores with fallback to lowest value
-            priority_score = priority_map.get(priority, 0.2)
-            impact_score = impact_map.get(impact, 0.2)
-            value_score = value_map.get(value, 0.2)
-            
-            # Calculate weighted average (prioritizing customer impact)
-            return (priority_score * 0.3 + impact_score * 0.4 + value_score * 0.3)
-            
-        except Exception as e:
-            print(f"Error calculating impact score: {str(e)}")
-            return 0.0
-    
-    def _analyze_temporal_patterns(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Analyze trends over time in feature requests."""
-        try:
-            # Convert request dates to datetime
-            df['Request Date'] = pd.to_datetime(df['Request Date'])
-            
-            # Group by month and count requests
-            monthly_counts = df.groupby(df['Request Date'].dt.strftime('%b'))['Feature Title'].count()
-            
-            # Convert to list of dictionaries
-            trends = [
-                {'month': month, 'requests': int(count)}
-                for month, count in monthly_counts.items()
-            ]
-            
-            return {
-                'trends': sorted(trends, key=lambda x: datetime.strptime(x['month'], '%b'))
-            }
-            
-        except Exception as e:
-            print(f"Error analyzing temporal patterns: {str(e)}")
-            return {'trends': []}
-    
-    def _analyze_customer_engagement(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Analyze customer engagement based on request patterns."""
-        try:
-            # Count requests by requester
-            requester_counts = df['Requested By'].value_counts()
-            
-            # Convert to list of dictionaries
-            return [
-                {'customer': requester, 'requests': int(count)}
-                for requester, count in requester_counts.head(3).items()
-            ]
-            
-        except Exception as e:
-            print(f"Error analyzing customer engagement: {str(e)}")
-            return []
-    
-    def _get_requests_by_category(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Get distribution of requests by category/type."""
-        try:
-            # Count requests by type
-            type_counts = df['Type'].value_counts()
-            total_requests = len(df)
-            
-            # Convert to list of dictionaries with percentages
-            return [
-                {
-                    'category': category,
-                    'percentage': int((count / total_requests) * 100)
-                }
-                for category, count in type_counts.items()
-            ]
-            
-        except Exception as e:
-            print(f"Error getting requests by category: {str(e)}")
-            return []
-    
-    def _get_requests_by_customer_type(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Get distribution of requests by customer type."""
-        try:
-            # Count requests by customer type
-            customer_type_counts = df['Customer Type'].value_counts()
-            total_requests = len(df)
-            
-            # Convert to list of dictionaries with counts and percentages
-            return [
-                {
-                    'type': ctype,
-                    'count': int(count),
-                    'percentage': int((count / total_requests) * 100)
-                }
-                for ctype, count in customer_type_counts.items()
-            ]
-            
-        except Exception as e:
-            print(f"Error getting requests by customer type: {str(e)}")
-            return []
-    
-    def _calculate_priority_score(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Calculate overall priority score based on multiple factors."""
-        try:
-            # Convert priority levels to numeric scores
-            priority_map = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
-            df['priority_score'] = df['Priority'].map(priority_map)
-            
-            # Calculate weighted average considering impact and value
-            impact_map = {'Low': 1, 'Medium': 2, 'High': 3}
-            df['impact_score'] = df['Customer Impact'].map(impact_map)
-            df['value_score'] = df['Business Value'].map(impact_map)
-            
-            # Combine scores with weights
-            weighted_score = (
-                df['priority_score'] * 0.4 +
-                df['impact_score'] * 0.3 +
-                df['value_score'] * 0.3
-            ).mean()
-            
-            # Normalize to 0-10 scale
-            normalized_score = (weighted_score / 4) * 10
-            
-            return {
-                'score': f"{normalized_score:.1f}",
-                'description': 'Based on priority, customer impact, and business value'
-            }
-            
-        except Exception as e:
-            print(f"Error calculating priority score: {str(e)}")
-            return {'score': '0.0', 'description': 'Error calculating score'}
+    def _calculate_impact_scores(self, aggregates: FeatureAggregates) -> np.ndarray:
+        """Calculate normalized impact scores from priority, impact, and business value for all rows."""
+        # Convert string values to numeric scores, falling back to the lowest value
+        priority_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8, 'Critical': 1.0}
+        impact_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8}
+        value_map = {'Low': 0.2, 'Medium': 0.5, 'High': 0.8}
+
+        def column_scores(column: str, mapping: Dict[str, float]) -> np.ndarray:
+            if column not in aggregates:
+                return np.full(aggregates.n_rows, 0.2)
+            return aggregates.scores(column, mapping, default=0.2)
+
+        # Weighted average (prioritizing customer impact)
+        return (column_scores('Priority', priority_map) * 0.3 +
+                column_scores('Customer Impact', impact_map) * 0.4 +
+                column_scores('Business Value', value_map) * 0.3)
     
     def _get_cluster_insights(self, cluster_results: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Get detailed insights from clustering analysis."""
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_N_NEIGHBORS = 30
+
+def graph_fingerprint(text_hashes: List[str]) -> str:
+    """Identify the exact row set a graph was built over."""
+    digest = hashlib.sha256()
+    for text_hash in text_hashes:
+        digest.update(text_hash.encode('utf-8'))
+    return digest.hexdigest()
+
+class KnnGraph:
+    """Cosine k-nearest-neighbour graph over a dataset's embeddings, built once.
+
+    The graph is computed lazily with NN-descent the first time a stage asks
+    for it and then shared: UMAP receives it as ``precomputed_knn`` and the
+    random-knn layout smooths over it. With a store, dataset id and
+    fingerprint the graph is cached next to the embedding matrix, so repeated
+    analyses of the same rows skip the neighbour search entirely.
+
+    ``get()`` returns ``(indices, distances, search_index)``; each row lists
+    the point itself first, as UMAP expects. ``search_index`` is the
+    NNDescent index needed to place new points later, or None for tiny inputs.
+    """
+
+    def __init__(self, embeddings: np.ndarray, n_neighbors: int = DEFAULT_N_NEIGHBORS, store=None,
+                 dataset_id: Any = None, model: str = None, fingerprint: str = None):
+        self.embeddings = embeddings
+        self.n_neighbors = n_neighbors
+        self.store = store
+        self.dataset_id = dataset_id
+        self.model = model
+        self.fingerprint = fingerprint
+        self._graph = None
+        self._lock = threading.Lock()
+
+    @property
+    def cacheable(self) -> bool:
+        return bool(self.store and self.dataset_id is not None and self.model and self.fingerprint)
+
+    def get(self) -> Tuple[np.ndarray, np.ndarray, Optional[Any]]:
+        with self._lock:
+            if self._graph is None:
+                self._graph = self._load() or self._build()
+            return self._graph
+
+    def _load(self):
+        if not self.cacheable:
+            return None
+        try:
+            graph = self.store.load_knn(self.dataset_id, self.model, self.fingerprint)
+        except Exception as e:
+            print(f"Warning: Error loading stored kNN graph: {str(e)}")
+            return None
+        if graph is not None and graph[0].shape[1] >= min(self.n_neighbors, len(self.embeddings)):
+            print(f"Using stored kNN graph for dataset {self.dataset_id}")
+            return graph
+        return None
+
+    def _build(self):
+        n_points = len(self.embeddings)
+        n_neighbors = min(self.n_neighbors, n_points)
+
+        if n_points <= self.n_neighbors:
+            # Too few rows for NN-descent; exact neighbours are trivial here
+            from sklearn.neighbors import NearestNeighbors
+            nn = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine', algorithm='brute')
+            distances, indices = nn.fit(self.embeddings).kneighbors(self.embeddings)
+            search_index = None
+        else:
+            from pynndescent import NNDescent
+            # NN-descent's compiled kernels reject read-only (memory-mapped) arrays
+            search_index = NNDescent(
+                np.require(self.embeddings, dtype=np.float32, requirements=['C', 'W']),
+                n_neighbors=n_neighbors,
+                metric='cosine',
+                random_state=42,
+                low_memory=True
+            )
+            indices, distances = search_index.neighbor_graph
+
+        graph = (indices.astype(np.int32), distances.astype(np.float32), search_index)
+        if self.cacheable:
+            try:
+                self.store.save_knn(self.dataset_id, self.model, self.fingerprint, *graph)
+            except Exception as e:
+                print(f"Warning: Error saving kNN graph: {str(e)}")
+        return graph
@@ -0,0 +1,56 @@
+import os
+import pickle
+import re
+import uuid
+from typing import Any, Dict, Optional
+
+class ProjectionStore:
+    """Fitted 2D projections persisted per dataset lineage.
+
+    An entry holds the fitted reducer, the dataset version it was last used
+    for, the text hashes of every placed row with their coordinates, and
+    counters used to decide when the layout has drifted enough to refit.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or os.getenv('PROJECTION_STORE_DIR', 'projection_store')
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+        return os.path.join(self.root, f"{safe_key}.pkl")
+
+    def lock_path(self, key: str) -> str:
+        """Path of the file locked while the entry's lineage is being analyzed."""
+        return f"{self._path(key)[:-len('.pkl')]}.lock"
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored projection entry, or None when absent or unreadable."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load stored projection {key}: {str(e)}")
+            return None
+
+    def save(self, key: str, entry: Dict[str, Any]) -> None:
+        """Atomically replace the stored projection entry."""
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+class ClusterStateStore(ProjectionStore):
+    """Cluster assignments persisted per dataset lineage.
+
+    An entry holds the dataset version and text hashes the labels belong to,
+    the distance threshold they were cut at, and counters used to decide when
+    incremental updates have drifted far enough to re-cluster from scratch.
+    """
+
+    def __init__(self, root: str = None):
+        super().__init__(root or os.getenv('CLUSTER_STATE_DIR', 'cluster_state'))
@@ -0,0 +1,54 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator, List, Sequence, Tuple
+
+# SQLite caps the number of host parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+class SQLiteCache:
+    """Base for the least-recently-used caches kept in a local SQLite file.
+
+    Subclasses name the ``table`` that holds one row per cached entry with a
+    ``last_used`` timestamp, and create their schema through ``_connect``.
+    """
+
+    table = None
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived transaction; SQLite handles locking across threads and processes."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _chunks(values: Sequence) -> Iterator[Tuple[List, str]]:
+        """Split values for ``IN (...)`` queries, yielding each chunk with its placeholders."""
+        for start in range(0, len(values), QUERY_CHUNK_SIZE):
+            chunk = list(values[start:start + QUERY_CHUNK_SIZE])
+            yield chunk, ','.join('?' * len(chunk))
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Drop least recently used entries down to 90% of capacity once the cap is exceeded.
+
+        Returns the number of entries evicted.
+        """
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count <= self.max_entries:
+            return 0
+
+        excess = count - int(self.max_entries * 0.9)
+        conn.execute(f"""
+            DELETE FROM {self.table} WHERE rowid IN (
+                SELECT rowid FROM {self.table} ORDER BY last_used ASC LIMIT ?
+            )
+        """, (excess,))
+        print(f"Evicted {excess} {self.table} from cache")
+        return excess
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from .sqlite_cache import SQLiteCache
+
+# Default bound on stored cluster themes
+DEFAULT_MAX_ENTRIES = 50000
+
+# Minimum Jaccard overlap for a stored theme to be reused by a changed cluster
+DEFAULT_MIN_JACCARD = 0.8
+
+def member_id(feature: Dict[str, Any]) -> str:
+    """Identify a feature by the text a theme is derived from (title and description)."""
+    title = ' '.join(str(feature.get('Feature Title', '') or '').split())
+    desc = ' '.join(str(feature.get('Description', '') or '').split())
+    return hashlib.sha256(f"{title}\n{desc}".encode('utf-8')).hexdigest()
+
+class ThemeCache(SQLiteCache):
+    """Persistent cluster themes keyed by cluster membership and labeler.
+
+    A cluster's key is the hash of its sorted member ids, namespaced by the
+    labeler (theme mode and model), so re-analysing the same data relabels
+    identical clusters instantly and deterministically. Member ids are also
+    indexed per theme, which lets a cluster whose membership changed slightly
+    reuse the stored theme when the Jaccard overlap is at least
+    ``min_jaccard``. Least recently used themes are evicted past ``max_entries``.
+    """
+
+    table = 'themes'
+
+    def __init__(self, path: str = None, max_entries: int = None, min_jaccard: float = None):
+        super().__init__(
+            path or os.getenv('THEME_CACHE_PATH', 'theme_cache.db'),
+            max_entries or int(os.getenv('THEME_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        )
+        self.min_jaccard = min_jaccard if min_jaccard is not None else \
+            float(os.getenv('THEME_CACHE_MIN_JACCARD', DEFAULT_MIN_JACCARD))
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS themes (
+                    labeler TEXT NOT NULL,
+                    membership_key TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    theme TEXT NOT NULL,
+                    keywords TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (labeler, membership_key)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS theme_members (
+                    labeler TEXT NOT NULL,
+                    member TEXT NOT NULL,
+                    membership_key TEXT NOT NULL,
+                    PRIMARY KEY (labeler, member, membership_key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_themes_last_used ON themes (last_used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_theme_members_key ON theme_members (labeler, membership_key)")
+
+    @staticmethod
+    def membership_key(members: Iterable[str]) -> str:
+        """Hash a cluster's member ids, independent of their order."""
+        return hashlib.sha256('\n'.join(sorted(set(members))).encode('utf-8')).hexdigest()
+
+    def get_many(self, labeler: str, clusters: Dict[int, List[str]]) -> Dict[int, Dict[str, Any]]:
+        """Return stored themes for clusters given as ``{cluster_id: [member ids]}``.
+
+        Exact membership matches are tried first; the remaining clusters take
+        the stored theme with the highest Jaccard overlap above the threshold.
+        Each hit is ``{'theme', 'keywords', 'source', 'jaccard'}``.
+        """
+        found = {}
+        if not clusters:
+            return found
+
+        keys = {cluster_id: self.membership_key(members) for cluster_id, members in clusters.items()}
+        with self._connect() as conn:
+            hits = {}
+            for chunk, placeholders in self._chunks(list(set(keys.values()))):
+                rows = conn.execute(
+                    f"SELECT membership_key, theme, keywords, source FROM themes "
+                    f"WHERE labeler = ? AND membership_key IN ({placeholders})",
+                    [labeler] + chunk
+                ).fetchall()
+                for key, theme, keywords, source in rows:
+                    hits[key] = (theme, keywords, source)
+
+            used = set()
+            for cluster_id, key in keys.items():
+                if key in hits:
+                    theme, keywords, source = hits[key]
+                    found[cluster_id] = {'theme': theme, 'keywords': json.loads(keywords),
+                                         'source': source, 'jaccard': 1.0}
+                    used.add(key)
+
+            if self.min_jaccard < 1:
+                for cluster_id, members in clusters.items():
+                    if cluster_id in found:
+                        continue
+                    match = self._nearest(conn, labeler, set(members))
+                    if match:
+                        key, jaccard, theme, keywords, source = match
+                        found[cluster_id] = {'theme': theme, 'keywords': json.loads(keywords),
+                                             'source': source, 'jaccard': jaccard}
+                        used.add(key)
+
+            if used:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE themes SET last_used = ? WHERE labeler = ? AND membership_key = ?",
+                    [(now, labeler, key) for key in used]
+                )
+        return found
+
+    def _nearest(self, conn: sqlite3.Connection, labeler: str, members: set):
+        """Find the stored cluster with the largest membership overlap, if similar enough."""
+        overlaps = Counter()
+        for chunk, placeholders in self._chunks(list(members)):
+            rows = conn.execute(
+                f"SELECT membership_key FROM theme_members WHERE labeler = ? AND member IN ({placeholders})",
+                [labeler] + chunk
+            ).fetchall()
+            overlaps.update(key for (key,) in rows)
+        if not overlaps:
+            return None
+
+        best = None
+        for chunk, placeholders in self._chunks(list(overlaps)):
+            rows = conn.execute(
+                f"SELECT membership_key, size, theme, keywords, source FROM themes "
+                f"WHERE labeler = ? AND membership_key IN ({placeholders})",
+                [labeler] + chunk
+            ).fetchall()
+            for key, size, theme, keywords, source in rows:
+                overlap = overlaps[key]
+                jaccard = overlap / (size + len(members) - overlap)
+                if jaccard >= self.min_jaccard and (best is None or jaccard > best[1]):
+                    best = (key, jaccard, theme, keywords, source)
+        return best
+
+    def put_many(self, labeler: str, entries: List[Dict[str, Any]]) -> None:
+        """Store themes given as ``{'members', 'theme', 'keywords', 'source'}`` dicts."""
+        if not entries:
+            return
+
+        now = time.time()
+        theme_rows, member_rows = [], []
+        for entry in entries:
+            members = set(entry['members'])
+            key = self.membership_key(members)
+            theme_rows.append((labeler, key, len(members), entry['theme'],
+                               json.dumps(entry.get('keywords', [])), entry['source'], now))
+            member_rows.extend((labeler, member, key) for member in members)
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO themes (labeler, membership_key, size, theme, keywords, source, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                theme_rows
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO theme_members (labeler, member, membership_key) VALUES (?, ?, ?)",
+                member_rows
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Evict least recently used themes along with their member index rows."""
+        excess = super()._evict(conn)
+        if not excess:
+            return 0
+        conn.execute("""
+            DELETE FROM theme_members WHERE NOT EXISTS (
+                SELECT 1 FROM themes
+                WHERE themes.labeler = theme_members.labeler
+                AND themes.membership_key = theme_members.membership_key
+            )
+        """)
+        return excess
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from database import db_session
+from models.analysis_job import AnalysisJob
+
+DEFAULT_JOB_WORKERS = 2
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Active jobs refresh their heartbeat this often; a job whose heartbeat is
+# older than the stale limit belongs to a process that has died
+DEFAULT_HEARTBEAT_SECONDS = 15
+DEFAULT_STALE_SECONDS = 60
+
+class AnalysisJobQueue:
+    """Runs insight analyses in the background and records their progress.
+
+    Every job is an AnalysisJob row, so its status, finished stages and
+    result outlive the request that submitted it. Jobs run on a local pool of
+    ANALYSIS_JOB_WORKERS threads, each calling ``run(job, report_stage)``
+    with the job's dict; ``run`` returns the insights and calls
+    ``report_stage(stage)`` as analysis stages finish. A queued job is
+    cancelled before it starts. A running analysis cannot be interrupted,
+    so cancelling it only discards its result. The analysis_jobs table is
+    created by init_db.
+
+    Jobs only live in the pool of the process that queued them, which records
+    its pid on the row and refreshes ``heartbeat_at`` while they are active.
+    The database may be shared by processes on several hosts, so a job is
+    judged orphaned by its heartbeat alone: active jobs whose heartbeat is
+    older than ANALYSIS_JOB_STALE_SECONDS are marked failed at startup, on
+    every heartbeat and whenever such a job is read.
+    """
+
+    def __init__(self, run: Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]],
+                 max_workers: int = None):
+        self.run = run
+        self.max_workers = max_workers or int(os.getenv('ANALYSIS_JOB_WORKERS', DEFAULT_JOB_WORKERS))
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+        self.heartbeat_seconds = float(os.getenv('ANALYSIS_JOB_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS))
+        self.stale_seconds = float(os.getenv('ANALYSIS_JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS))
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._fail_stale_jobs('Interrupted by restart')
+        threading.Thread(target=self._heartbeat_loop, name='analysis-job-heartbeat', daemon=True).start()
+
+    def _is_stale(self, job: AnalysisJob) -> bool:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        return job.status in ACTIVE_STATUSES and (job.heartbeat_at is None or job.heartbeat_at < stale_before)
+
+    def _fail_stale_jobs(self, error: str = None) -> None:
+        """Fail active jobs of any process whose heartbeat has gone stale."""
+        db = self._session()
+        try:
+            orphaned = 0
+            for job in db.query(AnalysisJob).filter(AnalysisJob.status.in_(ACTIVE_STATUSES)):
+                if self._is_stale(job):
+                    job.status = 'failed'
+                    job.error = error or f"Worker process {job.worker_pid} stopped responding"
+                    job.finished_at = datetime.utcnow()
+                    orphaned += 1
+            db.commit()
+            if orphaned:
+                print(f"Marked {orphaned} orphaned analysis jobs as failed")
+        except Exception as e:
+            db.rollback()
+            print(f"Error recovering analysis jobs: {str(e)}")
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._futures)
+            if job_ids:
+                db = self._session()
+                try:
+                    db.query(AnalysisJob)\
+                        .filter(AnalysisJob.id.in_(job_ids), AnalysisJob.status.in_(ACTIVE_STATUSES))\
+                        .update({AnalysisJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error updating analysis job heartbeats: {str(e)}")
+                finally:
+                    db.close()
+            self._fail_stale_jobs()
+
+    def submit(self, context_id: int, dataset_id: int, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Record a queued job for a stored dataset and schedule it."""
+        db = self._session()
+        try:
+            job = AnalysisJob(
+                context_id=context_id,
+                dataset_id=dataset_id,
+                status='queued',
+                completed_stages=[],
+                options=options or {},
+                worker_pid=os.getpid(),
+                heartbeat_at=datetime.utcnow()
+            )
+            db.add(job)
+            db.commit()
+            job_data = job.to_dict()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        future = self.pool.submit(self._execute, job_data['id'])
+        with self._lock:
+            self._futures[job_data['id']] = future
+        future.add_done_callback(lambda _: self._forget(job_data['id']))
+        print(f"Queued analysis job {job_data['id']} for context {context_id}")
+        return job_data
+
+    def get(self, job_id: int, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Return a job, failing it first when its process stopped sending heartbeats."""
+        db = self._session()
+        try:
+            job = db.query(AnalysisJob).get(job_id)
+            if job is None:
+                return None
+            if self._is_stale(job):
+                job.status = 'failed'
+                job.error = f"Worker process {job.worker_pid} stopped responding"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                print(f"Analysis job {job_id} lost its worker")
+            return job.to_dict(include_result=include_result)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def cancel(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+
+        db = self._session()
+        try:
+            job = db.query(AnalysisJob).get(job_id)
+            if job is None:
+                return None
+            if job.status in ACTIVE_STATUSES:
+                job.status = 'cancelled'
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                print(f"Cancelled analysis job {job_id}")
+            return job.to_dict()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _session(self):
+        # A session of its own, so closing it never detaches the caller's
+        # thread-scoped objects
+        return db_session.session_factory()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.pool.shutdown(wait=wait)
+
+    def _forget(self, job_id: int) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _update(self, job_id: int, only_if: tuple = ACTIVE_STATUSES, **fields) -> bool:
+        """Apply ``fields`` to a job still in one of ``only_if`` statuses; False when it is not."""
+        db = self._session()
+        try:
+            job = db.query(AnalysisJob).get(job_id)
+            if job is None or job.status not in only_if:
+                return False
+            for name, value in fields.items():
+                setattr(job, name, value)
+            db.commit()
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _execute(self, job_id: int) -> None:
+        if not self._update(job_id, only_if=('queued',), status='running', started_at=datetime.utcnow(),
+                            heartbeat_at=datetime.utcnow()):
+            return
+        job = self.get(job_id)
+        completed_stages = []
+
+        def report_stage(stage: str) -> None:
+            completed_stages.append(stage)
+            try:
+                self._update(job_id, only_if=('running',), stage=stage, completed_stages=list(completed_stages))
+            except Exception as e:
+                print(f"Error recording stage {stage} of analysis job {job_id}: {str(e)}")
+
+        try:
+            print(f"Running analysis job {job_id}")
+            result = self.run(job, report_stage)
+        except Exception as e:
+            print(f"Error in analysis job {job_id}: {str(e)}")
+            print(traceback.format_exc())
+            self._update(job_id, only_if=('running',), status='failed', error=str(e),
+                         finished_at=datetime.utcnow())
+            return
+
+        status = 'failed' if result.get('clustering_error') else 'succeeded'
+        if self._update(job_id, only_if=('running',), status=status, result=result,
+                        error=result.get('clustering_error'), finished_at=datetime.utcnow()):
+            print(f"Analysis job {job_id} {status}")
+        else:
+            print(f"Analysis job {job_id} was cancelled; discarding its result")
@@ -0,0 +1,228 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: computations are only shared within a process
+    fcntl = None
+
+# How long a persisted result is served to other processes, in seconds
+DEFAULT_RESULT_TTL = 3600
+
+def json_default(value: Any) -> Any:
+    """Serialize numpy scalars as their Python values and anything else as a string."""
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+class _Flight:
+    """A computation in progress with the events it has published so far."""
+
+    def __init__(self):
+        self.future = Future()
+        self.events = []
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscriber: Callable[..., None]) -> None:
+        # Replay and registration happen under the lock, so no event is
+        # missed or delivered twice
+        with self.lock:
+            for event in self.events:
+                self._deliver(subscriber, event)
+            self.subscribers.append(subscriber)
+
+    def publish(self, *event) -> None:
+        with self.lock:
+            self.events.append(event)
+            for subscriber in self.subscribers:
+                self._deliver(subscriber, event)
+
+    @staticmethod
+    def _deliver(subscriber: Callable[..., None], event: tuple) -> None:
+        try:
+            subscriber(*event)
+        except Exception as e:
+            print(f"Error delivering flight event: {str(e)}")
+
+class SingleFlight:
+    """Shares one computation among concurrent callers of the same key.
+
+    Within a process the first caller of a key starts the computation and
+    later callers get the same future until it finishes. Across worker
+    processes an exclusive lock on ``<directory>/<key>.lock`` lets one
+    process compute while the others wait; the winner persists its result
+    next to the lock, so the waiters read it instead of computing again.
+    Persisted results are reused for ``ttl`` seconds unless ``fresh`` is
+    requested, and results failing ``cacheable`` are never persisted. Lock
+    files are removed when a computation ends, expired results when they are
+    next read, and a sweep every ``ttl`` seconds clears whatever is left.
+
+    ``compute(publish)`` may report progress by calling ``publish(*event)``.
+    Every caller of the key in this process can pass a ``subscriber``, which
+    receives the events published before it joined followed by the live
+    ones.
+    """
+
+    def __init__(self, directory: str = None, ttl: float = None,
+                 cacheable: Callable[[Dict[str, Any]], bool] = None):
+        self.directory = directory or os.getenv('INSIGHTS_RESULT_DIR', 'insights_results')
+        self.ttl = ttl if ttl is not None else float(os.getenv('INSIGHTS_RESULT_TTL', DEFAULT_RESULT_TTL))
+        self.cacheable = cacheable or (lambda result: True)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self, key: str, compute: Callable[[Callable[..., None]], Dict[str, Any]], fresh: bool = False,
+              subscriber: Callable[..., None] = None) -> Future:
+        """Return the future of ``key``'s computation, starting it unless one is in flight.
+
+        ``fresh`` skips persisted results and does not join a non-fresh
+        computation in progress.
+        """
+        flight_key = (key, fresh)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            joined = flight is not None
+            if not joined:
+                flight = _Flight()
+                flight.future.set_running_or_notify_cancel()
+                self._flights[flight_key] = flight
+            if subscriber is not None:
+                flight.subscribe(subscriber)
+        if joined:
+            print(f"Joining in-flight computation of {key}")
+            return flight.future
+
+        def run():
+            try:
+                flight.future.set_result(self._compute_locked(key, compute, fresh, flight.publish))
+            except BaseException as e:
+                flight.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._flights.pop(flight_key, None)
+
+        threading.Thread(target=run, name='single-flight', daemon=True).start()
+        return flight.future
+
+    def do(self, key: str, compute: Callable[[Callable[..., None]], Dict[str, Any]], fresh: bool = False,
+           subscriber: Callable[..., None] = None) -> Dict[str, Any]:
+        """Run or join ``key``'s computation and wait for its result."""
+        return self.start(key, compute, fresh, subscriber).result()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _compute_locked(self, key: str, compute: Callable[[Callable[..., None]], Dict[str, Any]], fresh: bool,
+                        publish: Callable[..., None]) -> Dict[str, Any]:
+        path = self._path(key)
+        lock_path = f"{path}.lock"
+        # Blocks while another process computes the same key
+        lock_file = self._acquire(lock_path)
+        try:
+            if not fresh:
+                result = self._load(path)
+                if result is not None:
+                    print(f"Using result persisted by another worker for {key}")
+                    return result
+            result = compute(publish)
+            if self.cacheable(result):
+                self._save(path, result)
+            return result
+        finally:
+            # Waiters still locking the removed file notice and retry
+            self._remove(lock_path)
+            lock_file.close()
+            self._maybe_sweep()
+
+    @staticmethod
+    def _acquire(lock_path: str):
+        """Open and exclusively lock ``lock_path``, retrying if it was removed while waiting."""
+        while True:
+            lock_file = open(lock_path, 'a+')
+            if fcntl is None:
+                return lock_file
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _maybe_sweep(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._last_sweep < self.ttl:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            self._sweep()
+        except Exception as e:
+            print(f"Warning: Error sweeping persisted results: {str(e)}")
+
+    def _sweep(self) -> None:
+        """Remove expired results, stale temporary files and lock files no process holds."""
+        expired_before = time.time() - self.ttl
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, '*.json*')):
+            try:
+                if os.path.getmtime(path) < expired_before:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        for lock_path in glob.glob(os.path.join(self.directory, '*.lock')):
+            try:
+                if os.path.getmtime(lock_path) >= expired_before:
+                    continue
+                with open(lock_path, 'a+') as lock_file:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            continue
+                    self._remove(lock_path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            print(f"Removed {removed} expired result files")
+
+    def _load(self, path: str):
+        try:
+            if time.time() - os.path.getmtime(f"{path}.json") >= self.ttl:
+                self._remove(f"{path}.json")
+                return None
+            with open(f"{path}.json", encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Error loading persisted result: {str(e)}")
+            return None
+
+    def _save(self, path: str, result: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.json.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, default=json_default)
+            os.replace(tmp_path, f"{path}.json")
+        except Exception as e:
+            print(f"Warning: Error persisting result: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)